@@ -0,0 +1,115 @@
+import queue
+import time
+
+import torch
+
+from alphazero.network import Network
+from alphazero.weights import WeightSubscriber
+
+USE_CUDA = torch.cuda.is_available()
+
+# 가중치로 평가 모드의 신경망을 만드는 함수
+def load_network(board_size, state_dict):
+    network = Network(board_size)
+    if USE_CUDA:
+        network = network.cuda()
+
+    network.load_state_dict(state_dict)
+    network.eval()
+
+    return network
+
+# 여러 작업자의 신경망 연산 요청을 모아서 한 번에 처리하는 추론 서버
+# 요청은 (작업자 번호, 가중치 버전, 입력 Tensor)이고, 결과는 작업자의 응답 큐에 (policy, value, 가중치 버전)으로 넣는다.
+# 가중치 버전이 None인 요청은 새 대국의 첫 요청이므로 최신 가중치로 계산하고, 그 대국은 끝날 때까지 같은 버전으로 계산한다.
+# weights_dir이 주어지면 poll_interval초마다 새 가중치가 나왔는지 확인해서 불러오고,
+# 이전 가중치는 그 가중치로 두는 대국이 모두 끝나면 지운다.
+def inference_server(board_size, state_dict, request_queue, response_queues, max_batch_size=64, max_latency=0.005, \
+    weights_dir=None, version=0, poll_interval=1.0):
+    networks = {version: load_network(board_size, state_dict)}
+    # 작업자마다 지금 두고 있는 대국의 가중치 버전
+    worker_versions = {}
+
+    subscriber = WeightSubscriber(weights_dir, version) if weights_dir is not None else None
+    next_poll = time.time() + poll_interval
+
+    while True:
+        requests = [request_queue.get()]
+
+        if subscriber is not None and time.time() >= next_poll:
+            update = subscriber.poll()
+            if update is not None:
+                version, state_dict = update
+                networks[version] = load_network(board_size, state_dict)
+            next_poll = time.time() + poll_interval
+        batch_size = requests[0][2].size(0)
+
+        # 첫 요청이 들어온 뒤 max_latency초 동안 다른 요청을 더 모은다.
+        deadline = time.time() + max_latency
+        while batch_size < max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                requests.append(request_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+            batch_size += requests[-1][2].size(0)
+
+        # 새 대국을 시작한 작업자는 최신 가중치를 쓰고, 아무 대국도 쓰지 않는 이전 가중치는 지운다.
+        for i, (worker_id, request_version, in_data) in enumerate(requests):
+            if request_version is None:
+                worker_versions[worker_id] = version
+                requests[i] = (worker_id, version, in_data)
+
+        in_use = set(worker_versions.values())
+        for old_version in list(networks):
+            if old_version != version and old_version not in in_use:
+                del networks[old_version]
+
+        # 가중치 버전마다 요청을 모아서 한 번에 계산한다.
+        for batch_version in set(request_version for _, request_version, _ in requests):
+            batch = [(worker_id, in_data) for worker_id, request_version, in_data in requests if request_version == batch_version]
+
+            in_data = torch.cat([in_data for _, in_data in batch], dim=0)
+            if USE_CUDA:
+                in_data = in_data.cuda()
+
+            with torch.no_grad():
+                policy, value = networks[batch_version](in_data)
+            policy, value = policy.cpu(), value.cpu()
+
+            start = 0
+            for worker_id, in_data in batch:
+                end = start + in_data.size(0)
+                response_queues[worker_id].put((policy[start:end].clone(), value[start:end].clone(), batch_version))
+                start = end
+
+# 추론 서버에 신경망 연산을 요청하는 클래스
+# AZAgent에 신경망 대신 넘겨서 쓸 수 있다.
+class RemoteNetwork:
+    # 초기화 메소드
+    def __init__(self, worker_id, request_queue, response_queue):
+        self.worker_id = worker_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+
+        # 이번 대국에서 쓰는 가중치의 버전 (대국의 첫 요청에 대한 응답으로 정해진다.)
+        self.version = None
+
+    # 새 대국을 시작하는 메소드 (다음 요청부터 추론 서버의 최신 가중치를 쓴다.)
+    def new_game(self):
+        self.version = None
+
+    # 추론 서버는 항상 평가 모드로 연산하므로 아무 일도 하지 않는 메소드
+    def eval(self):
+        return self
+
+    # 연산하는 메소드
+    def __call__(self, x):
+        self.request_queue.put((self.worker_id, self.version, x.cpu()))
+        policy, value, self.version = self.response_queue.get()
+
+        return policy, value
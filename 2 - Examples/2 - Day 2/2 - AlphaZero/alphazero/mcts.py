@@ -4,9 +4,11 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
-from alphazero import preprocess
+from alphazero import preprocess, symmetry
 from alphazero.network import Network
+from alphazero.transposition import TranspositionTable
 from connect5 import agent
+from connect5.board import Move, SearchState
 from connect5.types import Player
 from connect5.utils import coords_from_point
 
@@ -15,14 +17,17 @@ USE_CUDA = torch.cuda.is_available()
 # AlphaZero의 MCTS 노드 클래스
 class MCTSNode(object):
     # 초기화 메소드
-    def __init__(self, state, prob, parent, action):
-        self.state = state
+    def __init__(self, prob, parent, action):
         self.parent = parent
         self.action = action
 
         self.prob = prob
         self.visit_count = 0
         self.win_count = 0
+        # 아직 역전파되지 않은 탐색의 수(가상 손실)
+        self.virtual_loss = 0
+        # 탐색으로 증명된 결과 (이 노드로 수를 둔 플레이어 기준으로 1: 승리, 0: 무승부, -1: 패배, None: 모름)
+        self.proven = None
 
         self.children = {}
 
@@ -35,13 +40,12 @@ class MCTSNode(object):
         return self.children[move]
 
     # policy head 값을 바탕으로 자식을 만드는 메소드
-    def expand(self, probs):
-        probs = probs.view(self.state.board.num_rows, self.state.board.num_cols)
+    def expand(self, indices, num_cols, probs):
+        probs = probs.view(-1)[torch.from_numpy(indices)].tolist()
 
-        for move in self.state.legal_moves():
-            new_state = self.state.apply_move(move)
-            prob = probs[move.point.row - 1][move.point.col - 1].item()
-            self.children[move] = MCTSNode(new_state, prob, self, move)
+        for index, prob in zip(indices.tolist(), probs):
+            move = Move.from_index(index, num_cols)
+            self.children[move] = MCTSNode(prob, self, move)
 
     # 자식 노드가 있는지 판단하는 메소드
     def expanded(self):
@@ -52,6 +56,16 @@ class MCTSNode(object):
         self.visit_count += 1
         self.win_count += value
         
+    # 자식 노드들의 증명된 결과로 이 노드의 결과를 정하는 메소드
+    # 자식 노드의 결과는 이 노드에서 둘 차례인 플레이어 기준이므로 부호를 바꿔서 저장한다.
+    def resolve(self):
+        proven = [child.proven for child in self.children.values()]
+
+        if 1 in proven:
+            self.proven = -1
+        elif None not in proven:
+            self.proven = -max(proven)
+
     # 노드에 dirichlet noise를 추가하는 메소드
     def inject_noise(self, alpha, eps):
         noise = np.random.dirichlet([alpha] * len(self.children))
@@ -65,90 +79,343 @@ class MCTSNode(object):
             child.prob /= total_value
 
     # 정책을 구하는 메소드
-    def pi(self):
-        ret = np.zeros((self.state.board.num_rows, self.state.board.num_cols))
+    def pi(self, num_rows, num_cols):
+        ret = np.zeros((num_rows, num_cols))
 
         for child in self.children.values():
             ret[child.action.point.row - 1][child.action.point.col - 1] = child.visit_count / self.visit_count
 
         return ret.reshape(-1)
 
+    # 가상 손실을 포함한 방문 횟수를 구하는 메소드
+    @property
+    def num_visits(self):
+        return self.visit_count + self.virtual_loss
+
     # Q값을 구하는 메소드
     @property
     def q_value(self):
-        if self.visit_count == 0:
+        if self.num_visits == 0:
             return 0
 
-        return self.win_count / self.visit_count
+        # 가상 손실은 진 것으로 계산해서 다른 탐색이 같은 경로로 내려오지 않게 한다.
+        return (self.win_count - self.virtual_loss) / self.num_visits
 
 # AlphaZero 방식으로 돌을 놓는 에이전트
 class AZAgent(agent.Agent):
     # 초기화 메소드
-    def __init__(self, board_size, state_dict, noise=False, alpha=0.03, eps=0.25, rounds_per_move=1600, puct_init=1.25, puct_base=19652):
-        self.network = Network(board_size)
-        if USE_CUDA:
-            self.network = self.network.cuda()
+    def __init__(self, board_size, state_dict, noise=False, alpha=0.03, eps=0.25, rounds_per_move=1600, puct_init=1.25, puct_base=19652, table_size=0, reuse_tree=True, batch_size=1, network=None, symmetry_mode='none', \
+        time_budget_ms=None, safety_margin_ms=50, early_stop=False, full_search_prob=0.25):
+        # network가 주어지면(예: 추론 서버의 RemoteNetwork) 신경망을 새로 만들지 않고 그대로 쓴다.
+        if network is None:
+            network = Network(board_size)
+            if USE_CUDA:
+                network = network.cuda()
+
+            network.load_state_dict(state_dict)
 
-        self.network.load_state_dict(state_dict)
+        self.network = network
+        self.use_cuda = isinstance(network, Network) and next(network.parameters()).is_cuda
+        # 여러 국면을 한 번에 계산해도 결과가 같도록 batch normalization을 평가 모드로 둔다.
+        self.network.eval()
 
         self.noise = noise
         self.alpha = alpha
         self.eps = eps
 
         self.num_rounds = rounds_per_move
+        # time_budget_ms가 주어지면 num_rounds를 채우지 못해도 시간이 다 되면 탐색을 멈춘다.
+        self.time_budget_ms = time_budget_ms
+        self.safety_margin_ms = safety_margin_ms
+        # early_stop이 True이면 남은 탐색으로 가장 많이 방문한 행동이 바뀔 수 없거나 승패가 증명되면 탐색을 멈춘다.
+        self.early_stop = early_stop
+        # early_stop이 True일 때 끝까지 탐색해서 학습 데이터로 기록할 수의 비율 (나머지 수는 일찍 멈출 수 있고 기록하지 않는다.)
+        self.full_search_prob = full_search_prob
         self.puct_init = puct_init
         self.puct_base = puct_base
+        # 한 번의 신경망 연산으로 평가할 잎 노드의 개수
+        self.batch_size = batch_size
+        # 잎 노드의 입력값을 써넣을 Tensor (GPU로 보낼 때는 pinned memory를 쓴다.)
+        self.inputs = torch.zeros((batch_size, preprocess.TENSOR_DIM, board_size, board_size), pin_memory=self.use_cuda)
+
+        # 같은 국면을 다시 만나면 신경망을 다시 계산하지 않고 저장된 결과를 쓴다.
+        self.table = TranspositionTable(table_size) if table_size > 0 else None
+
+        # 오목판의 대칭을 이용해서 국면을 평가하는 방법
+        # 'none': 그대로 평가한다.
+        # 'random': 무작위 대칭 변환을 적용해서 평가한다.
+        # 'average': 8가지 대칭 변환을 한 번에 평가해서 평균을 낸다.
+        # 'canonical': 대칭인 국면들의 대표 국면으로 바꿔서 평가하고, 대표 국면을 키 값으로 결과를 저장한다.
+        assert symmetry_mode in ('none', 'random', 'average', 'canonical')
+        # 대표 국면은 저장된 결과를 함께 쓰기 위한 것이므로 결과를 저장할 표가 있어야 한다.
+        assert symmetry_mode != 'canonical' or self.table is not None, "symmetry_mode='canonical' requires table_size > 0"
+        self.symmetry_mode = symmetry_mode
+
+        # 이전 탐색 트리를 다음 수에서도 이어서 쓴다.
+        self.reuse_tree = reuse_tree
+        self.root = None
+        self.root_key = None
 
         self.train_data = []
 
+        # 탐색 통계 (수의 개수, 탐색 횟수, 일찍 멈춰서 아낀 탐색 횟수, 일찍 멈춘 횟수, 승패가 증명되어 멈춘 횟수)
+        self.stats = self.empty_stats()
+
+    # 비어 있는 탐색 통계를 만드는 메소드
+    @staticmethod
+    def empty_stats():
+        return {
+            'moves': 0,
+            'simulations': 0,
+            'saved_simulations': 0,
+            'early_stops': 0,
+            'proven_stops': 0,
+            'recorded_moves': 0,
+        }
+
     # 돌 놓을 위치를 결정하는 메소드
     def select_move(self, game_state, c_puct=None):
-        root = MCTSNode(game_state, 0, None, None)
+        deadline = agent.Deadline(self.time_budget_ms, self.safety_margin_ms)
+        root = self.find_root(game_state)
+        state = SearchState.from_game_state(game_state)
+        encoder = preprocess.StateEncoder.from_moves(state.board.num_rows, state.board.num_cols, state.moves)
 
-        for i in range(self.num_rounds):
-            node = root
-            # 선택하는 부분
-            while node.expanded():
-                node = self.select_node(node, c_puct)
-
-            in_data = torch.FloatTensor(preprocess.StateToTensor(node.state))
-            if USE_CUDA:
-                in_data = in_data.cuda()
-
-            policy, value = self.network(in_data)
-            value = value.item()
+        if self.noise and root.expanded():
+            root.inject_noise(self.alpha, self.eps)
 
-            if not node.state.is_over():
-                # 확장하는 부분
-                policy = F.softmax(policy, dim=1)
-                node.expand(policy)
+        # 이어서 쓰는 트리는 방문 횟수가 num_rounds가 될 때까지만 탐색한다.
+        num_rounds = max(self.num_rounds - root.visit_count, 1)
+        self.stats['moves'] += 1
 
-                if self.noise and node.is_root():
-                    node.inject_noise(self.alpha, self.eps)
+        # 일찍 멈춘 탐색의 방문 횟수는 정책으로 쓰기에 부족하므로 무작위로 고른 일부 수만 끝까지 탐색해서 기록한다.
+        full_search = not self.early_stop or np.random.random_sample() < self.full_search_prob
 
-            # 역전파 하는 부분
-            value = -value # 신경망의 출력값과 노드의 승률은 기준이 다르기 때문에 -1을 곱해준다.
-            while node is not None:
-                node.update(value)
-                node = node.parent
+        # 시간은 잎 노드를 모아서 평가할 때마다 확인하고, 루트 노드는 적어도 한 번 확장한다.
+        while num_rounds > 0 and not (root.expanded() and deadline.expired()):
+            if not full_search and self.should_stop(root, num_rounds):
+                self.stats['saved_simulations'] += num_rounds
+                break
 
-                value = -value
+            # 루트 노드가 확장되기 전에는 잎 노드를 하나만 모은다.
+            batch_size = min(self.batch_size if root.expanded() else 1, num_rounds)
+            num_rounds -= batch_size
+            self.stats['simulations'] += batch_size
 
-        in_data = preprocess.StateToTensor(game_state)
-        self.train_data.append((in_data, root.pi(), game_state.next_player))
-
-        return max(root.children.values(), key=lambda x: x.visit_count).action
+            # 선택하는 부분
+            leaves = []
+            for _ in range(batch_size):
+                path = [root]
+                while path[-1].expanded():
+                    node = self.select_node(path[-1], c_puct)
+                    state.play(node.action)
+                    encoder.play(node.action)
+                    path.append(node)
+
+                # 끝난 국면이면 마지막에 둔 플레이어가 이겼는지(1) 비겼는지(0) 기록한다.
+                outcome = None
+                if state.is_over():
+                    outcome = 0 if state.winner == "Draw" else 1
+
+                encoder.encode(self.inputs[len(leaves)])
+                leaves.append((path, state.key(), outcome, state.legal_indices()))
+
+                # 가상 손실을 더하고 탐색 상태를 루트 노드로 되돌린다.
+                for node in path:
+                    node.virtual_loss += 1
+                for _ in range(len(path) - 1):
+                    state.undo()
+                    encoder.undo()
+
+            # 평가하는 부분
+            results = self.evaluate([key for _, key, _, _ in leaves], self.inputs[:batch_size])
+
+            for (path, _, outcome, indices), (policy, value) in zip(leaves, results):
+                node = path[-1]
+                if outcome is None and not node.expanded():
+                    # 확장하는 부분
+                    node.expand(indices, state.board.num_cols, policy)
+
+                    if self.noise and node.is_root():
+                        node.inject_noise(self.alpha, self.eps)
+
+                # 역전파 하는 부분
+                value = -value # 신경망의 출력값과 노드의 승률은 기준이 다르기 때문에 -1을 곱해준다.
+                for node in reversed(path):
+                    node.virtual_loss -= 1
+                    node.update(value)
+
+                    value = -value
+
+                # 증명된 결과를 루트 노드 쪽으로 전파하는 부분
+                if self.early_stop and outcome is not None:
+                    path[-1].proven = outcome
+                    for node in reversed(path[:-1]):
+                        node.resolve()
+                        if node.proven is None:
+                            break
+
+        num_rows, num_cols = game_state.board.num_rows, game_state.board.num_cols
+
+        # 이기는 것이 증명된 행동이 있으면 그 행동을 고르고, 정책도 그 행동에만 1을 준다.
+        winning = [child for child in root.children.values() if child.proven == 1]
+        if len(winning) > 0:
+            best = winning[0]
+            pi = np.zeros(num_rows * num_cols)
+            pi[(best.action.point.row - 1) * num_cols + best.action.point.col - 1] = 1
+        else:
+            # 시간이 모자라 방문 횟수가 같으면 사전 확률이 높은 행동을 고른다.
+            best = max(root.children.values(), key=lambda x: (x.visit_count, x.prob))
+            pi = root.pi(num_rows, num_cols)
+
+        if full_search:
+            in_data = preprocess.StateToTensor(game_state)
+            self.train_data.append((in_data, pi, game_state.next_player))
+            self.stats['recorded_moves'] += 1
+
+        if self.reuse_tree:
+            self.root = root
+            self.root_key = game_state.key()
+
+        return best.action
+
+    # 탐색을 일찍 멈춰도 되는지 판단하는 메소드
+    # 승패가 증명됐거나, 남은 탐색을 모두 두 번째로 많이 방문한 행동에 써도 가장 많이 방문한 행동을 넘을 수 없으면 멈춘다.
+    def should_stop(self, root, num_rounds):
+        if not root.expanded():
+            return False
+
+        if root.proven is not None:
+            self.stats['proven_stops'] += 1
+            return True
+
+        if len(root.children) < 2:
+            self.stats['early_stops'] += 1
+            return True
+
+        first, second = sorted((child.visit_count for child in root.children.values()), reverse=True)[:2]
+        if first - second > num_rounds:
+            self.stats['early_stops'] += 1
+            return True
+
+        return False
+
+    # 이전 탐색 트리에서 현재 게임 상태에 해당하는 노드를 찾는 메소드
+    def find_root(self, game_state):
+        if self.root is None:
+            return MCTSNode(0, None, None)
+
+        # 자신의 수와 상대의 수까지 최대 두 수를 거슬러 올라가며 이전 루트 노드를 찾는다.
+        moves = []
+        state = game_state
+        while state is not None and len(moves) <= 2:
+            if state.key() == self.root_key:
+                node = self.root
+                for move in reversed(moves):
+                    if move not in node.children:
+                        return MCTSNode(0, None, None)
+                    node = node.get_child(move)
+                node.parent = None
+                return node
+
+            moves.append(state.last_move)
+            state = state.previous_state
+
+        return MCTSNode(0, None, None)
+
+    # 새 대국을 시작할 수 있도록 탐색 트리, 평가 결과, 학습 데이터를 비우는 메소드
+    # network가 주어지면 그 신경망으로 바꾸고, 아니면 신경망을 그대로 두므로 대국마다 에이전트를 새로 만들지 않아도 된다.
+    def reset(self, network=None):
+        if network is not None:
+            self.network = network
+            self.network.eval()
+
+        self.root = None
+        self.root_key = None
+        self.train_data = []
+        self.stats = self.empty_stats()
+
+        if self.table is not None:
+            self.table.clear()
+
+    # 신경망으로 여러 국면의 정책과 가치를 한 번에 구하는 메소드
+    def evaluate(self, keys, in_data):
+        results = [None] * len(keys)
+        num_rows, num_cols = in_data.size(2), in_data.size(3)
+
+        # 'canonical'은 대표 국면으로 바꾸고 대표 국면의 바이트 값을 키 값으로 쓴다.
+        symmetries = [0] * len(keys)
+        if self.symmetry_mode == 'canonical':
+            keys = list(keys)
+            for i in range(len(keys)):
+                symmetries[i], keys[i] = symmetry.canonical(in_data[i])
+                if symmetries[i] != 0:
+                    in_data[i] = symmetry.transform_tensor(in_data[i], symmetries[i])
+
+        missing = []
+        for i, key in enumerate(keys):
+            if self.table is not None:
+                results[i] = self.table.get(key)
+            if results[i] is None:
+                missing.append(i)
+
+        # 'random'은 신경망으로 연산할 국면에만 무작위 대칭 변환을 적용한다.
+        if self.symmetry_mode == 'random':
+            for i in missing:
+                symmetries[i] = np.random.randint(symmetry.NUM_SYMMETRIES)
+                if symmetries[i] != 0:
+                    in_data[i] = symmetry.transform_tensor(in_data[i], symmetries[i])
+
+        if len(missing) > 0:
+            if len(missing) < len(keys):
+                in_data = in_data[missing]
+            if self.use_cuda:
+                in_data = in_data.cuda(non_blocking=True)
+
+            if self.symmetry_mode == 'average':
+                in_data = torch.cat([symmetry.transform_tensor(in_data, k) for k in range(symmetry.NUM_SYMMETRIES)], dim=0)
+
+            with torch.no_grad():
+                policy, value = self.network(in_data)
+            policy = F.softmax(policy, dim=1)
+
+            if self.symmetry_mode == 'average':
+                policy = policy.view(symmetry.NUM_SYMMETRIES, len(missing), num_rows, num_cols)
+                policy = torch.stack([symmetry.inverse_transform_tensor(policy[k], k) for k in range(symmetry.NUM_SYMMETRIES)])
+                policy = policy.mean(dim=0).view(len(missing), -1)
+                value = value.view(symmetry.NUM_SYMMETRIES, len(missing)).mean(dim=0)
+
+            for j, i in enumerate(missing):
+                policy_i = policy[j:j + 1]
+                # 'random'은 원래 국면 기준으로 저장하고, 'canonical'은 대표 국면 기준으로 저장한다.
+                if self.symmetry_mode == 'random' and symmetries[i] != 0:
+                    policy_i = self.restore_policy(policy_i, symmetries[i], num_rows, num_cols)
+                    symmetries[i] = 0
+
+                results[i] = (policy_i, value[j].item())
+                if self.table is not None:
+                    self.table.put(keys[i], results[i][0].clone(), results[i][1])
+
+        # 정책을 원래 오목판 기준으로 되돌리는 부분
+        for i, k in enumerate(symmetries):
+            if k != 0:
+                results[i] = (self.restore_policy(results[i][0], k, num_rows, num_cols), results[i][1])
+
+        return results
+
+    # 대칭 변환한 오목판 기준의 정책을 원래 오목판 기준으로 되돌리는 메소드
+    def restore_policy(self, policy, k, num_rows, num_cols):
+        return symmetry.inverse_transform_tensor(policy.view(num_rows, num_cols), k).reshape(1, -1)
 
     # 다음 자식 노드를 선택하는 메소드
     def select_node(self, node, c_puct):
-        sqrt_total_visit = math.sqrt(max(node.visit_count, 1))
+        sqrt_total_visit = math.sqrt(max(node.num_visits, 1))
 
         def score(move):
             child = node.get_child(move)
 
             q_value = child.q_value
-            puct = math.log((1 + child.visit_count + self.puct_base) / self.puct_base) + self.puct_init if c_puct is None else c_puct
-            u_value = puct * child.prob * sqrt_total_visit / (1 + child.visit_count)
+            puct = math.log((1 + child.num_visits + self.puct_base) / self.puct_base) + self.puct_init if c_puct is None else c_puct
+            u_value = puct * child.prob * sqrt_total_visit / (1 + child.num_visits)
 
             return q_value + u_value
 
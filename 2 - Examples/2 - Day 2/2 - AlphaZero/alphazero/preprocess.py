@@ -1,30 +1,106 @@
 import numpy as np 
+import torch
 
-from connect5.types import Player, Point
+from connect5.types import Player
 
 PAST_MOVES = 4
 TENSOR_DIM = PAST_MOVES * 2 + 1
 
-# 오목판을 Tensor로 만들어주는 함수
-def StateToTensor(state):
-    rows, cols = state.board.num_rows, state.board.num_cols
-
-    data = np.zeros((TENSOR_DIM, rows, cols))
-    
+# 오목판의 특징 평면들을 (TENSOR_DIM, 행, 열) 크기의 배열에 써넣는 함수
+def write_planes(state, data):
     data[TENSOR_DIM - 1, :, :] = 1 if state.next_player == Player.black else 0
 
     current, opponent = state.next_player, state.next_player.other
 
     for move in range(min(PAST_MOVES, len(state.previous_states))):
-        for x in range(cols):
-            for y in range(rows):
-                point = Point(col=x+1, row=y+1)
+        grid = state.board.to_array()
 
-                if state.board.get(point) == current:
-                    data[2 * move + 0, y, x] = 1
-                elif state.board.get(point) == opponent:
-                    data[2 * move + 1, y, x] = 1
+        data[2 * move + 0] = grid == current
+        data[2 * move + 1] = grid == opponent
 
         state = state.previous_state
 
+    return data
+
+# 오목판을 Tensor로 만들어주는 함수
+def StateToTensor(state):
+    rows, cols = state.board.num_rows, state.board.num_cols
+
+    data = np.zeros((TENSOR_DIM, rows, cols), dtype=np.float32)
+    write_planes(state, data)
+
     return data.reshape(1, TENSOR_DIM, rows, cols)
+
+# 여러 오목판을 (N, TENSOR_DIM, 행, 열) 크기의 Tensor로 만들어주는 함수
+def states_to_tensor(states):
+    rows, cols = states[0].board.num_rows, states[0].board.num_cols
+
+    data = np.zeros((len(states), TENSOR_DIM, rows, cols), dtype=np.float32)
+    for i, state in enumerate(states):
+        write_planes(state, data[i])
+
+    return torch.from_numpy(data)
+
+# 돌을 놓고 되돌릴 때마다 바뀐 칸만 갱신하여 오목판을 Tensor로 만들어주는 클래스
+# 최근 PAST_MOVES개의 오목판을 (흑돌, 백돌) 평면으로 원형 버퍼에 저장한다.
+class StateEncoder:
+    # 초기화 메소드
+    def __init__(self, num_rows, num_cols):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.planes = torch.zeros((PAST_MOVES, 2, num_rows, num_cols), dtype=torch.uint8)
+        self.moves = []
+        self.next_player = Player.black
+
+    # 지금까지 놓은 행동들로 인코더를 만드는 메소드
+    @classmethod
+    def from_moves(cls, num_rows, num_cols, moves):
+        encoder = StateEncoder(num_rows, num_cols)
+        for move in moves:
+            encoder.play(move)
+        return encoder
+
+    # 돌을 놓는 행동을 적용하는 메소드
+    def play(self, move):
+        current = len(self.moves) % PAST_MOVES
+        latest = (len(self.moves) + 1) % PAST_MOVES
+        point = move.point
+
+        self.planes[latest] = self.planes[current]
+        self.planes[latest, self.next_player - 1, point.row - 1, point.col - 1] = 1
+
+        self.moves.append(move)
+        self.next_player = self.next_player.other
+
+    # 마지막으로 놓은 돌을 되돌리는 메소드
+    def undo(self):
+        self.moves.pop()
+        self.next_player = self.next_player.other
+
+        # 새로 덮어썼던 자리에 PAST_MOVES - 1수 전의 오목판을 다시 만든다.
+        oldest = len(self.moves) - (PAST_MOVES - 1)
+        slot = (len(self.moves) + 1) % PAST_MOVES
+        if oldest <= 0:
+            self.planes[slot] = 0
+            return
+
+        # 흑돌이 먼저 두므로 짝수 번째 행동은 흑돌, 홀수 번째 행동은 백돌이 놓은 것이다.
+        player = Player.black if oldest % 2 == 0 else Player.white
+        point = self.moves[oldest].point
+        self.planes[slot] = self.planes[(slot + 1) % PAST_MOVES]
+        self.planes[slot, player - 1, point.row - 1, point.col - 1] = 0
+
+    # (TENSOR_DIM, 행, 열) 크기의 Tensor에 현재 상태를 써넣는 메소드
+    def encode(self, out):
+        out = out.view(TENSOR_DIM, self.num_rows, self.num_cols)
+        current, opponent = self.next_player, self.next_player.other
+
+        num_boards = min(PAST_MOVES, len(self.moves))
+        slots = [(len(self.moves) - move) % PAST_MOVES for move in range(num_boards)]
+
+        history = out[:2 * num_boards].view(num_boards, 2, self.num_rows, self.num_cols)
+        history.copy_(self.planes[slots][:, [current - 1, opponent - 1]])
+        out[2 * num_boards:TENSOR_DIM - 1] = 0
+        out[TENSOR_DIM - 1] = 1 if current == Player.black else 0
+
+        return out
@@ -1,28 +1,94 @@
+import os
+
 import numpy as np
 import torch
 
+from alphazero import symmetry
+from alphazero.sumtree import SumTree
 from connect5.types import Player
 
+# 샘플 하나를 저장하는 고정 크기 레코드의 형식을 만드는 함수
+# state는 0과 1로만 이루어져 있으므로 비트 단위로 압축해서 저장한다.
+# version은 샘플을 만든 신경망 가중치의 버전이다.
+def record_dtype(state_bytes, pi_size):
+    return np.dtype([
+        ('state', np.uint8, (state_bytes,)),
+        ('pi', np.float16, (pi_size,)),
+        ('value', np.int8),
+        ('version', np.uint32),
+    ])
+
 # 자가 대국의 결과를 저장하는 버퍼
+# 미리 할당한 배열을 원형 버퍼로 써서 넣고 지우는 연산을 O(1)에 처리한다.
+# augment가 True이면 샘플을 뽑을 때마다 무작위 대칭 변환(회전, 뒤집기)을 적용한다.
+# prioritized가 True이면 샘플마다 손실 값으로 정한 우선순위를 sum-tree에 저장해서 우선순위에 비례하게 뽑을 수 있다.
 class ReplayBuffer:
     # 초기화 메소드
-    def __init__(self, capacity):
+    def __init__(self, capacity, augment=False, prioritized=False, alpha=0.6, beta=0.4, eps=1e-3):
         self.capacity = capacity
-        self.buffer = []
+        self.augment = augment
+        self.records = None
+        self.state_shape = None
+
+        # 가장 오래된 샘플의 위치와 샘플의 개수
+        self.start = 0
+        self.size = 0
+
+        # 우선순위는 (손실 + eps) ** alpha이고, beta는 중요도 가중치의 보정 정도이다.
+        self.priorities = SumTree(capacity) if prioritized else None
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.max_priority = 1.0
+
+    # 첫 샘플의 크기에 맞춰서 버퍼를 할당하는 메소드
+    def allocate(self, state_shape, pi_size):
+        self.state_shape = tuple(state_shape)
+        state_bytes = (int(np.prod(self.state_shape)) + 7) // 8
+
+        self.records = np.zeros(self.capacity, dtype=record_dtype(state_bytes, pi_size))
 
     # 버퍼를 전부 비우는 메소드
     def clear(self):
-        self.buffer = []
+        self.start = 0
+        self.size = 0
+
+        if self.priorities is not None:
+            self.priorities.clear()
 
     # 버퍼의 절반만 비우는 메소드
     def clear_half(self):
-        length = len(self.buffer) // 2
+        length = self.size // 2
+
+        if self.priorities is not None and length > 0:
+            self.priorities.update(self.positions(np.arange(length)), 0)
+
+        self.start = (self.start + length) % self.capacity
+        self.size -= length
+
+    # 샘플 하나를 버퍼의 끝에 넣는 메소드 (버퍼가 가득 차면 가장 오래된 샘플을 덮어쓴다.)
+    def append(self, state, pi, value, version=0):
+        index = (self.start + self.size) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+        record = self.records[index]
+        record['state'] = np.packbits(state.reshape(-1).astype(np.uint8))
+        record['pi'] = pi
+        record['value'] = value
+        record['version'] = version
 
-        self.buffer = self.buffer[length:]
+        # 새 샘플은 적어도 한 번은 뽑히도록 지금까지의 가장 큰 우선순위를 준다.
+        if self.priorities is not None:
+            self.priorities.update([index], self.max_priority)
+
+        return index
 
     # 버퍼에 데이터를 넣는 메소드
-    def push(self, winner, data):
-        if winner is 'Draw':
+    def push(self, winner, data, version=0):
+        if winner == 'Draw':
             winner = None
         else:
             winner = Player.black if winner == 'Black' else Player.white
@@ -33,25 +99,152 @@ class ReplayBuffer:
             else:
                 value = 1 if winner == color else -1
 
-            self.buffer.append((state, pi, value))
+            if self.records is None:
+                self.allocate(state.shape[1:], pi.size)
+
+            self.append(state, pi, value, version)
+
+    # 버퍼 안의 순서를 배열의 위치로 바꾸는 메소드
+    def positions(self, indicies):
+        return (self.start + indicies) % self.capacity
+
+    # 배열의 위치에 있는 샘플들을 Tensor로 만드는 메소드
+    def gather(self, positions):
+        records = self.records[positions]
+        size = len(positions)
+
+        num_bits = int(np.prod(self.state_shape))
+        states = np.unpackbits(records['state'], axis=1, count=num_bits).reshape((size,) + self.state_shape)
+
+        pis = np.ascontiguousarray(records['pi'], dtype=np.float32)
+        values = np.ascontiguousarray(records['value'], dtype=np.float32)
 
-        if len(self.buffer) > self.capacity:
-            self.buffer = self.buffer[-self.capacity:]
+        if self.augment:
+            states, pis = symmetry.random_transform(states, pis)
+
+        return torch.from_numpy(states).float(), torch.from_numpy(pis).view(size, -1), torch.from_numpy(values).view(size, 1)
 
     # 버퍼에서 무작위로 샘플을 추출하는 메소드
     def sample(self, size):
-        indicies = np.random.choice(len(self.buffer), size, replace=False)
+        indicies = np.random.choice(self.size, size, replace=False)
+
+        return self.gather(self.positions(indicies))
+
+    # 버퍼에서 우선순위에 비례하게 샘플을 추출하는 메소드
+    # 샘플과 함께 중요도 가중치와 우선순위를 갱신할 때 쓸 배열의 위치를 반환한다.
+    def sample_prioritized(self, size):
+        # 우선순위의 합을 size개의 구간으로 나누고 구간마다 하나씩 뽑는다.
+        total = self.priorities.total()
+        values = (np.arange(size) + np.random.uniform(size=size)) * (total / size)
+        positions = self.priorities.find(values)
 
-        states, pis, values = [], [], []
-        for i in indicies:
-            state, pi, value = self.buffer[i]
+        probs = self.priorities.get(positions) / total
+        weights = (self.size * probs) ** -self.beta
+        weights = torch.from_numpy((weights / weights.max()).astype(np.float32)).view(size, 1)
 
-            states.append(state)
-            pis.append(pi)
-            values.append(value)
+        states, pis, values = self.gather(positions)
 
-        return torch.FloatTensor(np.concatenate(states, axis=0)), torch.FloatTensor(pis).view(size, -1), torch.FloatTensor(values).view(size, 1)                                                                                      
+        return states, pis, values, weights, positions
+
+    # 샘플들의 손실 값으로 우선순위를 갱신하는 메소드
+    def update_priorities(self, positions, losses):
+        priorities = (np.abs(losses) + self.eps) ** self.alpha
+        self.priorities.update(positions, priorities)
+        self.max_priority = max(self.max_priority, float(np.max(priorities)))
 
     # 버퍼에 들어있는 샘플의 개수를 구하는 메소드
     def __len__(self):
-        return len(self.buffer)
+        return self.size
+
+# 파일 앞부분에 저장하는 버퍼의 정보
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('capacity', '<u8'),
+    ('start', '<u8'),
+    ('size', '<u8'),
+    ('state_shape', '<u4', (3,)),
+    ('pi_size', '<u4'),
+])
+HEADER_SIZE = 64
+MAGIC = b'AZRB'
+VERSION = 2
+
+# 샘플을 메모리 맵 파일에 저장하는 버퍼
+# 파일은 작은 헤더와 고정 크기 레코드들로 이루어져 있어서 필요한 레코드만 읽을 수 있고,
+# 학습을 다시 시작해도 이어서 쓸 수 있다.
+class MappedReplayBuffer(ReplayBuffer):
+    # 초기화 메소드
+    def __init__(self, path, capacity, resume=False, augment=False, prioritized=False, alpha=0.6, beta=0.4, eps=1e-3):
+        ReplayBuffer.__init__(self, capacity, augment, prioritized, alpha, beta, eps)
+        self.path = path
+        self.header = None
+
+        if resume and os.path.exists(path):
+            self.open()
+
+    # 이미 있는 파일을 여는 메소드
+    def open(self):
+        header = np.memmap(self.path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        if header['magic'][0] != MAGIC or header['version'][0] != VERSION:
+            raise ValueError(f'{self.path} is not a replay buffer file')
+        if header['capacity'][0] != self.capacity:
+            raise ValueError(f'{self.path} has capacity {header["capacity"][0]}, expected {self.capacity}')
+
+        self.header = header
+        self.start = int(header['start'][0])
+        self.size = int(header['size'][0])
+        self.map_records(tuple(int(dim) for dim in header['state_shape'][0]), int(header['pi_size'][0]), 'r+')
+
+        # 우선순위는 파일에 저장하지 않으므로 이어서 쓰는 샘플들은 모두 같은 우선순위로 시작한다.
+        if self.priorities is not None and self.size > 0:
+            self.priorities.update(self.positions(np.arange(self.size)), self.max_priority)
+
+    # 레코드 부분을 메모리에 맵핑하는 메소드
+    def map_records(self, state_shape, pi_size, mode):
+        self.state_shape = state_shape
+        state_bytes = (int(np.prod(self.state_shape)) + 7) // 8
+
+        self.records = np.memmap(self.path, dtype=record_dtype(state_bytes, pi_size), mode=mode,
+            offset=HEADER_SIZE, shape=(self.capacity,))
+
+    # 첫 샘플의 크기에 맞춰서 파일을 새로 만드는 메소드
+    def allocate(self, state_shape, pi_size):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * HEADER_SIZE)
+
+        self.header = np.memmap(self.path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        self.header['magic'] = MAGIC
+        self.header['version'] = VERSION
+        self.header['capacity'] = self.capacity
+        self.header['state_shape'] = state_shape
+        self.header['pi_size'] = pi_size
+
+        self.map_records(state_shape, pi_size, 'r+')
+        self.flush()
+
+    # 헤더의 위치 정보를 갱신하고 파일에 기록하는 메소드
+    def flush(self):
+        if self.header is None:
+            return
+
+        self.header['start'] = self.start
+        self.header['size'] = self.size
+
+        self.records.flush()
+        self.header.flush()
+
+    # 버퍼를 전부 비우는 메소드
+    def clear(self):
+        ReplayBuffer.clear(self)
+        self.flush()
+
+    # 버퍼의 절반만 비우는 메소드
+    def clear_half(self):
+        ReplayBuffer.clear_half(self)
+        self.flush()
+
+    # 버퍼에 데이터를 넣는 메소드
+    def push(self, winner, data, version=0):
+        ReplayBuffer.push(self, winner, data, version)
+        self.flush()
@@ -0,0 +1,57 @@
+import numpy as np
+
+# 각 노드에 자식 노드들의 우선순위 합을 저장하는 완전 이진 트리
+# 우선순위에 비례하는 샘플 추출과 우선순위 갱신을 O(log N)에 처리한다.
+class SumTree:
+    # 초기화 메소드
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+        # 잎 노드의 개수를 2의 거듭제곱으로 맞춘다. (1번 노드가 루트)
+        self.num_leaves = 1
+        while self.num_leaves < capacity:
+            self.num_leaves *= 2
+        self.depth = self.num_leaves.bit_length() - 1
+
+        self.tree = np.zeros(2 * self.num_leaves, dtype=np.float64)
+
+    # 우선순위의 합을 구하는 메소드
+    def total(self):
+        return self.tree[1]
+
+    # 위치에 있는 샘플들의 우선순위를 가져오는 메소드
+    def get(self, indicies):
+        return self.tree[self.num_leaves + np.asarray(indicies)]
+
+    # 위치에 있는 샘플들의 우선순위를 바꾸는 메소드
+    def update(self, indicies, priorities):
+        nodes = self.num_leaves + np.asarray(indicies).reshape(-1)
+        self.tree[nodes] = priorities
+
+        # 바뀐 잎 노드의 조상 노드들만 다시 더한다.
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    # 모든 우선순위를 0으로 만드는 메소드
+    def clear(self):
+        self.tree[:] = 0
+
+    # 누적 우선순위 값들에 해당하는 샘플의 위치를 찾는 메소드
+    def find(self, values):
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+
+        # 부동소수점 오차로 우선순위가 0인 잎 노드에 도착하면 그 앞에서 가장 가까운 샘플을 고른다.
+        indicies = np.minimum(nodes - self.num_leaves, self.capacity - 1)
+        for i in np.flatnonzero(self.tree[self.num_leaves + indicies] <= 0):
+            nonzero = np.flatnonzero(self.tree[self.num_leaves:self.num_leaves + indicies[i]] > 0)
+            indicies[i] = nonzero[-1] if len(nonzero) > 0 else np.flatnonzero(self.tree[self.num_leaves:] > 0)[0]
+
+        return indicies
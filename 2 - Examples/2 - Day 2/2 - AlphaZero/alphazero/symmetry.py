@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+
+# 정사각형 오목판의 대칭 변환(회전 4가지 x 뒤집기 2가지)의 개수
+NUM_SYMMETRIES = 8
+
+# 배열의 마지막 두 축(행, 열)에 k번째 대칭 변환을 적용하는 함수
+def transform(data, k):
+    if k >= 4:
+        data = np.flip(data, axis=-1)
+
+    return np.rot90(data, k % 4, axes=(-2, -1))
+
+# k번째 대칭 변환을 되돌리는 함수
+def inverse_transform(data, k):
+    data = np.rot90(data, -(k % 4), axes=(-2, -1))
+
+    if k >= 4:
+        data = np.flip(data, axis=-1)
+
+    return data
+
+# 샘플마다 무작위로 고른 대칭 변환을 (N, C, 행, 열) 크기의 state와 (N, 행 * 열) 크기의 pi에 적용하는 함수
+def random_transform(states, pis):
+    size, rows, cols = states.shape[0], states.shape[-2], states.shape[-1]
+    assert rows == cols
+
+    pis = pis.reshape(size, rows, cols)
+    symmetries = np.random.randint(NUM_SYMMETRIES, size=size)
+
+    # 같은 변환을 고른 샘플끼리 묶어서 한 번에 변환한다.
+    for k in range(1, NUM_SYMMETRIES):
+        indicies = np.flatnonzero(symmetries == k)
+        if len(indicies) == 0:
+            continue
+
+        states[indicies] = transform(states[indicies], k)
+        pis[indicies] = transform(pis[indicies], k)
+
+    return states, pis.reshape(size, -1)
+
+# Tensor의 마지막 두 축(행, 열)에 k번째 대칭 변환을 적용하는 함수
+def transform_tensor(data, k):
+    if k >= 4:
+        data = torch.flip(data, dims=(-1,))
+
+    return torch.rot90(data, k % 4, dims=(-2, -1))
+
+# Tensor에 적용한 k번째 대칭 변환을 되돌리는 함수
+def inverse_transform_tensor(data, k):
+    data = torch.rot90(data, -(k % 4), dims=(-2, -1))
+
+    if k >= 4:
+        data = torch.flip(data, dims=(-1,))
+
+    return data
+
+# 대칭 변환한 입력값 중 바이트 값이 가장 작은 것을 대표로 골라서 (변환 번호, 키 값)을 반환하는 함수
+# 서로 대칭인 국면들은 같은 키 값을 갖는다.
+def canonical(data):
+    best_k, best_key = 0, None
+    for k in range(NUM_SYMMETRIES):
+        key = transform_tensor(data, k).to(torch.uint8).cpu().numpy().tobytes()
+        if best_key is None or key < best_key:
+            best_k, best_key = k, key
+
+    return best_k, best_key
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+# 국면의 키 값으로 신경망의 평가 결과(정책, 가치)를 저장하는 표
+class TranspositionTable:
+    # 초기화 메소드
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.table = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    # 표를 전부 비우는 메소드
+    def clear(self):
+        self.table.clear()
+
+    # 키 값에 해당하는 평가 결과를 가져오는 메소드
+    def get(self, key):
+        entry = self.table.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.table.move_to_end(key)
+        self.hits += 1
+
+        return entry
+
+    # 평가 결과를 저장하는 메소드
+    def put(self, key, policy, value):
+        self.table[key] = (policy, value)
+        self.table.move_to_end(key)
+
+        # 가장 오랫동안 쓰이지 않은 결과부터 지운다.
+        if len(self.table) > self.capacity:
+            self.table.popitem(last=False)
+
+    # 표에 들어있는 결과의 개수를 구하는 메소드
+    def __len__(self):
+        return len(self.table)
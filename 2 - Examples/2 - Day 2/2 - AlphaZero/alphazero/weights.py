@@ -0,0 +1,97 @@
+import os
+
+import torch
+import torch.multiprocessing as mp
+
+# 최신 가중치와 그 버전을 저장하는 파일의 이름
+WEIGHTS_FILE = 'latest.bin'
+VERSION_FILE = 'latest.version'
+
+# 임시 파일에 쓴 뒤 이름을 바꿔서 읽는 쪽이 쓰다 만 파일을 보지 않게 하는 함수
+def atomic_write(path, write):
+    temp_path = path + '.tmp'
+    write(temp_path)
+    os.replace(temp_path, path)
+
+# 학습한 가중치를 버전과 함께 디렉터리에 내보내는 함수
+# 가중치 파일을 먼저 바꾸고 버전 파일을 나중에 바꾸므로 버전 파일이 바뀌었으면 가중치도 이미 바뀌어 있다.
+def publish_weights(directory, version, state_dict):
+    state_dict = {name: tensor.cpu() for name, tensor in state_dict.items()}
+    atomic_write(os.path.join(directory, WEIGHTS_FILE), lambda path: torch.save({'version': version, 'state_dict': state_dict}, path))
+
+    def write_version(path):
+        with open(path, 'w') as f:
+            f.write(str(version))
+    atomic_write(os.path.join(directory, VERSION_FILE), write_version)
+
+# 디렉터리의 버전 파일을 보고 새 가중치가 나왔는지 확인하는 클래스
+class WeightSubscriber:
+    # 초기화 메소드
+    def __init__(self, directory, version=0):
+        self.directory = directory
+        self.version = version
+
+    # 새 가중치가 있으면 (버전, 가중치)를, 없으면 None을 반환하는 메소드
+    def poll(self):
+        try:
+            with open(os.path.join(self.directory, VERSION_FILE)) as f:
+                version = int(f.read())
+        except (OSError, ValueError):
+            return None
+
+        if version == self.version:
+            return None
+
+        # 버전 파일을 읽은 뒤에 가중치가 또 바뀌었을 수 있으므로 버전은 가중치 파일에 저장된 값을 쓴다.
+        checkpoint = torch.load(os.path.join(self.directory, WEIGHTS_FILE), map_location='cpu')
+        self.version = checkpoint['version']
+
+        return self.version, checkpoint['state_dict']
+
+# 학습기와 자가 대국 작업자들이 공유 메모리로 함께 쓰는 두 벌의 신경망
+# 작업자는 대국을 시작할 때 사용 중인 신경망을 하나 빌려서 대국이 끝날 때까지 쓰고,
+# 학습기는 아무도 빌리지 않은 다른 신경망에만 새 가중치를 쓴 뒤 사용 중인 신경망을 바꾼다.
+class SharedWeights:
+    # 초기화 메소드 (networks는 같은 가중치를 가진 두 신경망이다.)
+    def __init__(self, networks, version=0):
+        for network in networks:
+            network.share_memory()
+            network.eval()
+
+        self.networks = networks
+        self.lock = mp.Lock()
+        self.active = mp.Value('i', 0, lock=False)
+        self.versions = mp.Array('l', [version] * len(networks), lock=False)
+        # 신경망마다 빌려서 쓰고 있는 작업자의 수
+        self.readers = mp.Array('i', [0] * len(networks), lock=False)
+
+    # 사용 중인 신경망을 빌리는 메소드 (번호, 신경망, 가중치 버전을 반환한다.)
+    def acquire(self):
+        with self.lock:
+            index = self.active.value
+            self.readers[index] += 1
+            return index, self.networks[index], self.versions[index]
+
+    # 빌린 신경망을 돌려주는 메소드
+    def release(self, index):
+        with self.lock:
+            self.readers[index] -= 1
+
+    # 새 가중치를 쓰고 사용 중인 신경망을 바꾸는 메소드
+    # 아직 다른 신경망을 빌려서 쓰는 작업자가 있으면 아무것도 하지 않고 False를 반환한다.
+    def publish(self, version, state_dict):
+        with self.lock:
+            index = 1 - self.active.value
+            if self.readers[index] > 0:
+                return False
+
+        # 사용 중이 아닌 신경망은 새로 빌려갈 수 없으므로 잠금 없이 써도 된다.
+        with torch.no_grad():
+            for shared, trained in zip(self.networks[index].state_dict().values(), state_dict.values()):
+                shared.copy_(trained)
+
+        with self.lock:
+            self.versions[index] = version
+            self.active.value = index
+
+        return True
@@ -0,0 +1,61 @@
+from __future__ import print_function
+
+from alphazero import preprocess
+from connect5 import board as connect5_board
+
+import numpy as np
+import torch
+import random
+import sys
+
+# StateEncoder가 무작위로 두고 무르는 동안 StateToTensor와 같은 입력값을 만드는지 확인하는 함수
+def check(board_size, backend, seed, num_steps=200):
+    random.seed(seed)
+    out = torch.empty((preprocess.TENSOR_DIM, board_size, board_size))
+
+    states = [connect5_board.GameState.new_game(board_size, backend)]
+    encoder = preprocess.StateEncoder(board_size, board_size)
+
+    for step in range(num_steps):
+        game = states[-1]
+        encoder.encode(out)
+        if not np.array_equal(out.numpy(), preprocess.StateToTensor(game)[0]):
+            return 'mismatch at step %d' % step
+
+        if game.is_over() or (len(states) > 1 and random.random() < 0.3):
+            states.pop()
+            encoder.undo()
+        else:
+            move = random.choice(game.legal_moves())
+            states.append(game.apply_move(move))
+            encoder.play(move)
+
+    # 수순으로 만든 StateEncoder도 같은 입력값을 만들어야 한다.
+    game = states[-1]
+    moves = connect5_board.SearchState.from_game_state(game).moves
+    preprocess.StateEncoder.from_moves(board_size, board_size, moves).encode(out)
+    if not np.array_equal(out.numpy(), preprocess.StateToTensor(game)[0]):
+        return 'mismatch after from_moves'
+
+    return None
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    failures = 0
+
+    for backend in connect5_board.BACKENDS:
+        for board_size in (5, 7, 9):
+            for seed in range(num_games):
+                error = check(board_size, backend, seed)
+                if error is not None:
+                    failures += 1
+                    print('%s %dx%d seed %d: %s' % (backend, board_size, board_size, seed, error))
+
+    if failures > 0:
+        print('%d games failed' % failures)
+        sys.exit(1)
+
+    print('StateEncoder matches StateToTensor')
+
+if __name__ == '__main__':
+    main()
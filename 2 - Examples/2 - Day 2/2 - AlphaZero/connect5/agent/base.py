@@ -1,3 +1,5 @@
+import time
+
 # 기본 에이전트 클래스
 class Agent:
     # 초기화 메소드
@@ -6,4 +8,25 @@ class Agent:
 
     # 행동을 선택하는 메소드
     def select_move(self, game_state):
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+
+# 한 수를 두는 데 쓸 수 있는 시간을 재는 클래스
+# 서버와 주고받는 데 걸리는 시간을 생각해서 safety_margin_ms만큼 일찍 끝낸다.
+# time_budget_ms가 None이면 시간 제한이 없다.
+class Deadline:
+    # 초기화 메소드
+    def __init__(self, time_budget_ms, safety_margin_ms=50):
+        if time_budget_ms is None:
+            self.end = None
+        else:
+            self.end = time.monotonic() + max(time_budget_ms - safety_margin_ms, 0) / 1000
+
+    # 시간이 다 됐는지 확인하는 메소드
+    def expired(self):
+        return self.end is not None and time.monotonic() >= self.end
+
+    # 남은 시간(초)을 구하는 메소드
+    def remaining(self):
+        if self.end is None:
+            return None
+        return max(self.end - time.monotonic(), 0)
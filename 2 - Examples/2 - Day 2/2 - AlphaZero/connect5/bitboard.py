@@ -0,0 +1,117 @@
+from connect5.types import Player, Point, Direction
+from connect5 import zobrist
+import numpy as np
+
+# 비트보드의 최대 크기(zobrist 해시 값이 준비된 크기)
+MAX_BOARD_SIZE = 19
+
+# 플레이어마다 하나의 정수에 돌의 위치를 비트로 저장하는 바둑판 클래스
+# 각 행의 끝에 빈 열을 하나씩 두어서 가로, 대각선으로 비트를 밀 때 다음 행으로 넘어가지 않게 한다.
+class BitBoard:
+    # 초기화 메소드
+    def __init__(self, num_rows, num_cols):
+        assert num_rows <= MAX_BOARD_SIZE and num_cols <= MAX_BOARD_SIZE
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self._stride = self.num_cols + 1
+        self._shifts = {
+            Direction.right: 1,
+            Direction.down: self._stride,
+            Direction.right_down: self._stride + 1,
+            Direction.left_down: self._stride - 1,
+        }
+        row_mask = (1 << self.num_cols) - 1
+        self._mask = 0
+        for row in range(self.num_rows):
+            self._mask |= row_mask << (row * self._stride)
+        self._stones = {
+            Player.black: 0,
+            Player.white: 0
+        }
+        self._hash = zobrist.EMPTY_BOARD
+        self.num_stones = 0
+
+    # 위치에 해당하는 비트를 구하는 메소드
+    def _bit(self, point):
+        return 1 << ((int(point.row) - 1) * self._stride + (int(point.col) - 1))
+
+    # 돌을 놓는 메소드
+    def place_stone(self, player, point):
+        assert self.is_on_grid(point)
+        assert self.get(point) == 0
+        self._stones[player] |= self._bit(point)
+        self._hash ^= zobrist.HASH_CODE[point, player]
+        self.num_stones += 1
+
+    # 놓인 돌을 들어내는 메소드
+    def remove_stone(self, point):
+        assert self.is_on_grid(point)
+        player = self.get(point)
+        assert player != 0
+        self._stones[player] &= ~self._bit(point)
+        self._hash ^= zobrist.HASH_CODE[point, player]
+        self.num_stones -= 1
+
+    # 좌표가 바둑판 내에 존재하는지 확인하는 메소드
+    def is_on_grid(self, point):
+        return 1 <= point.row <= self.num_rows and \
+            1 <= point.col <= self.num_cols
+
+    # 바둑판 내 위치에 있는 돌의 색깔(흑돌, 백돌, 빈돌)을 반환하는 메소드
+    def get(self, point):
+        bit = self._bit(point)
+        if self._stones[Player.black] & bit:
+            return Player.black
+        if self._stones[Player.white] & bit:
+            return Player.white
+        return 0
+
+    # 해시 값을 가져오는 메소드
+    def zobrist_hash(self):
+        return self._hash
+
+    # 바둑판이 가득 찼는지 확인하는 메소드
+    def is_full(self):
+        return self.num_stones == self.num_rows * self.num_cols
+
+    # 빈 위치를 차례대로 반환하는 메소드
+    def empty_points(self):
+        empty = self._mask & ~(self._stones[Player.black] | self._stones[Player.white])
+        while empty:
+            index = (empty & -empty).bit_length() - 1
+            empty &= empty - 1
+            yield Point(row=index // self._stride + 1, col=index % self._stride + 1)
+
+    # 비트로 저장한 위치들을 (행, 열) 크기의 bool 배열로 바꾸는 메소드
+    def _unpack(self, stones):
+        num_bits = self.num_rows * self._stride
+        bits = np.unpackbits(np.frombuffer(stones.to_bytes((num_bits + 7) // 8, 'little'), dtype=np.uint8), bitorder='little')
+        return bits[:num_bits].reshape(self.num_rows, self._stride)[:, :self.num_cols].astype(bool)
+
+    # 빈 위치를 True로 표시한 (행, 열) 크기의 배열을 반환하는 메소드
+    def empty_mask(self):
+        return self._unpack(self._mask & ~(self._stones[Player.black] | self._stones[Player.white]))
+
+    # 돌의 색깔을 (행, 열) 크기의 배열로 반환하는 메소드
+    def to_array(self):
+        grid = np.zeros((self.num_rows, self.num_cols), dtype=np.int8)
+        grid[self._unpack(self._stones[Player.black])] = Player.black
+        grid[self._unpack(self._stones[Player.white])] = Player.white
+        return grid
+
+    # 위치에 놓인 돌로 오목이 만들어졌는지 확인하는 메소드
+    def is_connect5(self, point):
+        player = self.get(point)
+        if player == 0:
+            return False
+        stones = self._stones[player]
+        bit = self._bit(point)
+        for shift in self._shifts.values():
+            # 같은 색깔인 돌이 정확히 4개 이어지는 줄의 시작 위치
+            run4 = stones & (stones >> shift) & (stones >> (2 * shift)) & (stones >> (3 * shift))
+            starts = run4 & ~(stones >> (4 * shift)) & ~(stones << shift)
+            # point를 지나는 줄이 시작할 수 있는 위치
+            window = bit | (bit >> shift) | (bit >> (2 * shift)) | (bit >> (3 * shift))
+            if starts & window:
+                return True
+        return False
@@ -1,6 +1,7 @@
 import copy
 from connect5.types import Player, Point, Direction
 from connect5 import zobrist
+from connect5.bitboard import BitBoard
 import numpy as np
 
 # 바둑판을 나타내는 클래스
@@ -11,12 +12,23 @@ class Board:
         self.num_cols = num_cols
         self._grid = np.zeros((self.num_rows + 1, self.num_cols + 1), dtype=np.int)
         self._hash = zobrist.EMPTY_BOARD
+        self.num_stones = 0
 
     # 돌을 놓는 메소드
     def place_stone(self, player, point):
         assert self.is_on_grid(point)
         assert self._grid[point.row, point.col] == 0
         self._grid[point.row, point.col] = player
+        self._hash ^= zobrist.HASH_CODE[point, player]
+        self.num_stones += 1
+
+    # 놓인 돌을 들어내는 메소드
+    def remove_stone(self, point):
+        assert self.is_on_grid(point)
+        assert self._grid[point.row, point.col] != 0
+        self._hash ^= zobrist.HASH_CODE[point, Player(self._grid[point.row, point.col])]
+        self._grid[point.row, point.col] = 0
+        self.num_stones -= 1
 
     # 좌표가 바둑판 내에 존재하는지 확인하는 메소드
     def is_on_grid(self, point):
@@ -32,6 +44,65 @@ class Board:
     def zobrist_hash(self):
         return self._hash
 
+    # 바둑판이 가득 찼는지 확인하는 메소드
+    def is_full(self):
+        return self.num_stones == self.num_rows * self.num_cols
+
+    # 빈 위치를 차례대로 반환하는 메소드
+    def empty_points(self):
+        for row, col in np.argwhere(self._grid[1:, 1:] == 0):
+            yield Point(row=int(row) + 1, col=int(col) + 1)
+
+    # 빈 위치를 True로 표시한 (행, 열) 크기의 배열을 반환하는 메소드
+    def empty_mask(self):
+        return self._grid[1:, 1:] == 0
+
+    # 돌의 색깔을 (행, 열) 크기의 배열로 반환하는 메소드
+    def to_array(self):
+        return self._grid[1:, 1:]
+
+    # 위치에 놓인 돌을 지나는 한 방향으로 같은 색깔인 돌이 몇 개 이어져 있는지 구하는 메소드
+    def count_connected(self, point, direction):
+        stone_color = self._grid[point.row, point.col]
+        d_row, d_col = direction.delta
+        count = 1
+        for sign in (1, -1):
+            r = point.row + sign * d_row
+            c = point.col + sign * d_col
+            while 1 <= r <= self.num_rows and 1 <= c <= self.num_cols and \
+                self._grid[r, c] == stone_color:
+                count += 1
+                r += sign * d_row
+                c += sign * d_col
+        return count
+
+    # 위치에 놓인 돌로 오목이 만들어졌는지 확인하는 메소드
+    def is_connect5(self, point):
+        for direction in Direction:
+            if self.count_connected(point, direction) == 4:
+                return True
+        return False
+
+# 바둑판의 해시 값에 다음 차례의 플레이어를 합친 키 값을 구하는 함수
+def position_key(board, next_player):
+    if next_player == Player.white:
+        return board.zobrist_hash() ^ zobrist.WHITE_TO_MOVE
+    return board.zobrist_hash()
+
+# 바둑판 종류의 이름과 클래스
+BACKENDS = {
+    'numpy': Board,
+    'bitboard': BitBoard,
+}
+
+# 마지막으로 놓인 돌을 바탕으로 승자를 구하는 함수
+def find_winner(board, point):
+    if board.is_connect5(point):
+        return "Black" if board.get(point) == Player.black else "White"
+    if board.is_full():
+        return "Draw"
+    return None
+
 # 행동을 나타내는 클래스
 class Move:
     # 초기화 메소드
@@ -44,10 +115,52 @@ class Move:
     def play(cls, point):
         return Move(point=point)
 
+    # 1차원으로 편 바둑판의 인덱스에 돌을 놓는 행동을 만드는 메소드
+    @classmethod
+    def from_index(cls, index, num_cols):
+        # numpy 정수가 들어와도 Point에는 파이썬 정수를 저장한다.
+        index = int(index)
+        return Move(point=Point(row=index // num_cols + 1, col=index % num_cols + 1))
+
     # 행동 정보를 출력하는 메소드
     def __str__(self):
         return '(r %d, c %d)' % (self.point.row, self.point.col)
 
+    # 같은 위치에 돌을 놓는 행동인지 비교하는 메소드
+    def __eq__(self, other):
+        return isinstance(other, Move) and self.point == other.point
+
+    # 행동의 해시 값을 구하는 메소드
+    def __hash__(self):
+        return hash(self.point)
+
+# 이전 게임 상태들을 앞선 기록과 공유하며 저장하는 클래스
+class StateHistory:
+    # 초기화 메소드
+    def __init__(self, item=None, parent=None):
+        self.item = item
+        self.parent = parent
+        self.length = 0 if parent is None else parent.length + 1
+
+    # 기록을 하나 추가한 새로운 기록을 반환하는 메소드
+    def add(self, item):
+        return StateHistory(item, self)
+
+    # 기록의 개수를 반환하는 메소드
+    def __len__(self):
+        return self.length
+
+    # 최근 기록부터 차례대로 반환하는 메소드
+    def __iter__(self):
+        node = self
+        while node.length > 0:
+            yield node.item
+            node = node.parent
+
+    # 기록에 포함되어 있는지 확인하는 메소드
+    def __contains__(self, item):
+        return any(entry == item for entry in self)
+
 # 게임 상태를 나타내는 클래스
 class GameState:
     # 초기화 메소드
@@ -56,11 +169,13 @@ class GameState:
         self.next_player = next_player
         self.previous_state = previous
         if self.previous_state is None:
-            self.previous_states = frozenset()
+            self.previous_states = StateHistory()
         else:
-            self.previous_states = frozenset(previous.previous_states |
-            {(previous.next_player, previous.board.zobrist_hash())})
+            self.previous_states = previous.previous_states.add(
+                (previous.next_player, previous.board.zobrist_hash()))
+        self.last_move = move
         self.winner = None
+        self._is_over = self.check_over(move)
 
     # 돌을 놓는 행동을 적용하는 메소드
     def apply_move(self, move):
@@ -70,113 +185,121 @@ class GameState:
 
     # 새로운 게임을 만드는 메소드
     @classmethod
-    def new_game(cls, board_size):
+    def new_game(cls, board_size, backend='numpy'):
         if isinstance(board_size, int):
             board_size = (board_size, board_size)
-        board = Board(*board_size)
+        board = BACKENDS[backend](*board_size)
         return GameState(board, Player.black, None, None)
 
     # 유효한 행동인지 확인하는 메소드
     def is_valid_move(self, move):
         return self.board.get(move.point) == 0
 
-    # 샅은 색깔인 돌의 개수가 5개를 초과하는지 확인하는 메소드
-    def is_middle(self, r, c, stone_color, direction):
-        if direction is Direction.right and self.board.is_on_grid(Point(row=r, col=c-1)):
-            if self.board._grid[r, c - 1] == stone_color:
-                return False
-        if direction is Direction.down and self.board.is_on_grid(Point(row=r-1, col=c)):
-            if self.board._grid[r - 1, c] == stone_color:
-                return False
-        if direction is Direction.right_down and self.board.is_on_grid(Point(row=r-1, col=c-1)):
-            if self.board._grid[r - 1, c - 1] == stone_color:
-                return False
-        if direction is Direction.left_down and self.board.is_on_grid(Point(row=r-1, col=c+1)):
-            if self.board._grid[r - 1, c + 1] == stone_color:
-                return False
-        return True
-
-    # 오목인지를 확인하는 메소드
-    def is_connect5(self, r, c, stone_color, direction):
-        if not self.is_middle(r, c, stone_color, direction):
-            return False
-        stones = []
-        stones.append(Point(r, c))
-        d_row = r
-        d_col = c
-        if direction is Direction.right:
-            d_col += 1
-            while self.board.is_on_grid(Point(row=d_row, col=d_col)) and \
-                self.board._grid[d_row, d_col] == stone_color:
-                stones.append(Point(row=d_row, col=d_col))
-                d_col += 1
-        elif direction is Direction.down:
-            d_row += 1
-            while self.board.is_on_grid(Point(row=d_row, col=d_col)) and \
-                self.board._grid[d_row, d_col] == stone_color:
-                stones.append(Point(row=d_row, col=d_col))
-                d_row += 1
-        elif direction is Direction.right_down:
-            d_row += 1
-            d_col += 1
-            while self.board.is_on_grid(Point(row=d_row, col=d_col)) and \
-                self.board._grid[d_row, d_col] == stone_color:
-                stones.append(Point(row=d_row, col=d_col))
-                d_row += 1
-                d_col += 1              
-        elif direction is Direction.left_down:
-            d_row += 1
-            d_col -= 1
-            while self.board.is_on_grid(Point(row=d_row, col=d_col)) and \
-                self.board._grid[d_row, d_col] == stone_color:
-                stones.append(Point(row=d_row, col=d_col))
-                d_row += 1
-                d_col -= 1
-        if len(stones) is 4:
-            return True
-        return False      
+    # 바둑판과 다음 차례의 플레이어로 국면을 구분하는 키 값을 반환하는 메소드
+    def key(self):
+        return position_key(self.board, self.next_player)
 
     # 게임이 끝났는지 확인하는 메소드
     def is_over(self):
-        is_full = True
+        return self._is_over
+
+    # 마지막으로 놓인 돌 주변만 검사하여 게임이 끝났는지 판단하는 메소드
+    def check_over(self, move):
+        if move is None:
+            return self.scan_over()
+        self.winner = find_winner(self.board, move.point)
+        return self.winner is not None
+
+    # 바둑판 전체를 검사하여 게임이 끝났는지 판단하는 메소드
+    def scan_over(self):
         for r in range(1, self.board.num_rows + 1):
             for c in range(1, self.board.num_cols + 1):
-                stone_color = self.board._grid[r, c]
-                if stone_color != 0:
-                    if self.board.is_on_grid(Point(row=r, col=c+1)) and \
-                        stone_color == self.board._grid[r, c + 1]:
-                        if self.is_connect5(r, c, stone_color, Direction.right):
-                            self.winner = "Black" if stone_color == Player.black else "White"
-                            return True
-                    if self.board.is_on_grid(Point(row=r+1, col=c)) and \
-                        stone_color == self.board._grid[r + 1, c]:
-                        if self.is_connect5(r, c, stone_color, Direction.down):
-                            self.winner = "Black" if stone_color == Player.black else "White"
-                            return True
-                    if self.board.is_on_grid(Point(row=r+1, col=c+1)) and \
-                        stone_color == self.board._grid[r + 1, c + 1]:
-                        if self.is_connect5(r, c, stone_color, Direction.right_down):
-                            self.winner = "Black" if stone_color == Player.black else "White"
-                            return True
-                    if self.board.is_on_grid(Point(row=r+1, col=c-1)) and \
-                        stone_color == self.board._grid[r + 1, c - 1]:
-                        if self.is_connect5(r, c, stone_color, Direction.left_down):
-                            self.winner = "Black" if stone_color == Player.black else "White"
-                            return True
-                else:
-                    is_full = False            
-        if is_full:
+                point = Point(row=r, col=c)
+                stone_color = self.board.get(point)
+                if stone_color != 0 and self.board.is_connect5(point):
+                    self.winner = "Black" if stone_color == Player.black else "White"
+                    return True
+        if self.board.is_full():
             self.winner = "Draw"
             return True
-        else:
-            return False
-    
+        return False
+
     # 유효한 행동 목록을 반환하는 메소드
     def legal_moves(self):
+        return [Move.play(point) for point in self.board.empty_points()]
+
+    # 유효한 위치를 True로 표시한 (행, 열) 크기의 배열을 반환하는 메소드
+    def legal_mask(self):
+        return self.board.empty_mask()
+
+    # 유효한 위치를 1차원으로 편 바둑판의 인덱스 배열로 반환하는 메소드
+    def legal_indices(self):
+        return np.flatnonzero(self.board.empty_mask())
+
+# 하나의 바둑판에 돌을 놓고 되돌리며 탐색하는 게임 상태 클래스
+class SearchState:
+    # 초기화 메소드
+    def __init__(self, board, next_player, moves, winner):
+        self.board = board
+        self.next_player = next_player
+        self.moves = moves
+        self.winners = [winner]
+
+    # 게임 상태로부터 탐색용 게임 상태를 만드는 메소드
+    @classmethod
+    def from_game_state(cls, game_state):
         moves = []
-        for row in range(1, self.board.num_rows + 1):
-            for col in range(1, self.board.num_cols + 1):
-                move = Move.play(Point(row, col))
-                if self.is_valid_move(move):
-                    moves.append(move)
-        return moves
+        state = game_state
+        while state is not None and state.last_move is not None:
+            moves.append(state.last_move)
+            state = state.previous_state
+        moves.reverse()
+        return SearchState(copy.deepcopy(game_state.board), game_state.next_player, moves, game_state.winner)
+
+    # 돌을 놓는 행동을 바둑판에 직접 적용하는 메소드
+    def play(self, move):
+        self.board.place_stone(self.next_player, move.point)
+        self.moves.append(move)
+        self.next_player = self.next_player.other
+        self.winners.append(find_winner(self.board, move.point))
+
+    # 마지막으로 놓은 돌을 되돌리는 메소드
+    def undo(self):
+        move = self.moves.pop()
+        self.board.remove_stone(move.point)
+        self.next_player = self.next_player.other
+        self.winners.pop()
+
+    # 승자를 반환하는 메소드
+    @property
+    def winner(self):
+        return self.winners[-1]
+
+    # 마지막 행동을 반환하는 메소드
+    @property
+    def last_move(self):
+        return self.moves[-1] if self.moves else None
+
+    # 게임이 끝났는지 확인하는 메소드
+    def is_over(self):
+        return self.winners[-1] is not None
+
+    # 바둑판과 다음 차례의 플레이어로 국면을 구분하는 키 값을 반환하는 메소드
+    def key(self):
+        return position_key(self.board, self.next_player)
+
+    # 유효한 행동인지 확인하는 메소드
+    def is_valid_move(self, move):
+        return self.board.get(move.point) == 0
+
+    # 유효한 행동 목록을 반환하는 메소드
+    def legal_moves(self):
+        return [Move.play(point) for point in self.board.empty_points()]
+
+    # 유효한 위치를 True로 표시한 (행, 열) 크기의 배열을 반환하는 메소드
+    def legal_mask(self):
+        return self.board.empty_mask()
+
+    # 유효한 위치를 1차원으로 편 바둑판의 인덱스 배열로 반환하는 메소드
+    def legal_indices(self):
+        return np.flatnonzero(self.board.empty_mask())
\ No newline at end of file
@@ -1,7 +1,14 @@
+import itertools
 import math
+import multiprocessing
+import os
 import random
+import threading
 
-from connect5 import agent
+import numpy as np
+
+from connect5 import agent, rollout
+from connect5.board import Move
 from connect5.types import Player
 from connect5.utils import coords_from_point
 
@@ -45,25 +52,28 @@ class MCTSNode(object):
         }
         self.num_rollouts = 0
         self.children = []
-        self.unvisited_moves = game_state.legal_moves()
+        self.unvisited_moves = game_state.legal_indices().tolist()
+        # 트리 병렬 탐색에서 다른 스레드가 탐색 중인 시뮬레이션의 횟수(가상 손실)와 노드를 보호하는 잠금
+        self.virtual_loss = 0
+        self.lock = threading.Lock()
 
     # 노드에 무작위 자식 노드를 추가하는 메소드
     def add_random_child(self):
         index = random.randint(0, len(self.unvisited_moves) - 1)
-        new_move = self.unvisited_moves.pop(index)
+        new_move = Move.from_index(self.unvisited_moves.pop(index), self.game_state.board.num_cols)
         new_game_state = self.game_state.apply_move(new_move)
         new_node = MCTSNode(new_game_state, self, new_move)
         self.children.append(new_node)
         return new_node
 
     # 노드의 값을 갱신하는 메소드
-    def record_win(self, winner):
+    def record_win(self, winner, count=1):
         if winner is 0:
-            self.win_counts[Player.black] += 1
-            self.win_counts[Player.white] += 1
+            self.win_counts[Player.black] += count
+            self.win_counts[Player.white] += count
         else:
-            self.win_counts[winner] += 1
-        self.num_rollouts += 1
+            self.win_counts[winner] += count
+        self.num_rollouts += count
 
     # 더 자식 노드를 추가할 수 있는지를 반환하는 메소드
     def can_add_child(self):
@@ -77,61 +87,204 @@ class MCTSNode(object):
     def winning_frac(self, player):
         return float(self.win_counts[player]) / float(self.num_rollouts)
 
+    # 가상 손실을 포함한 시뮬레이션 횟수를 구하는 메소드
+    @property
+    def num_visits(self):
+        return self.num_rollouts + self.virtual_loss
+
+# 프로세스 풀에서 독립된 트리를 탐색하고 루트의 자식 노드마다 (위치, 시뮬레이션 횟수, 이긴 횟수)를 반환하는 함수
+def search_independent_tree(args):
+    game_state, num_rounds, temperature, rollouts_per_leaf, seed, time_budget_ms = args
+
+    # 프로세스마다 다른 무작위 시뮬레이션을 하도록 씨앗 값을 정한다.
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+
+    bot = MCTSAgent(num_rounds, temperature, reuse_tree=False, rollouts_per_leaf=rollouts_per_leaf)
+    root = MCTSNode(game_state)
+    bot.search(root, num_rounds, agent.Deadline(time_budget_ms, 0))
+
+    return [(child.move.point, child.num_rollouts, child.win_counts[game_state.next_player]) for child in root.children]
+
 # MCTS 탐색 결과로 돌을 놓는 에이전트
 class MCTSAgent(agent.Agent):
     # 초기화 메소드
-    def __init__(self, num_rounds, temperature):
+    # parallel이 'root'이면 num_workers개의 프로세스에서 독립된 트리를 탐색해서 합치고,
+    # 'tree'이면 num_workers개의 스레드가 가상 손실을 써서 하나의 트리를 함께 탐색한다.
+    # 두 방법 모두 num_rounds를 전체 탐색 횟수로 나눠서 쓴다.
+    # time_budget_ms가 주어지면 num_rounds를 채우지 못해도 시간이 다 되면 탐색을 멈춘다.
+    def __init__(self, num_rounds, temperature, reuse_tree=True, rollouts_per_leaf=1, parallel=None, num_workers=None, \
+        time_budget_ms=None, safety_margin_ms=50):
         agent.Agent.__init__(self)
         self.num_rounds = num_rounds
         self.temperature = temperature
+        # 이전 탐색 트리를 다음 수에서도 이어서 쓴다.
+        self.reuse_tree = reuse_tree
+        self.root = None
+        # 잎 노드 하나에서 한꺼번에 돌릴 무작위 시뮬레이션의 횟수
+        self.rollouts_per_leaf = rollouts_per_leaf
+
+        assert parallel in (None, 'root', 'tree')
+        self.parallel = parallel
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.pool = None
+
+        self.time_budget_ms = time_budget_ms
+        self.safety_margin_ms = safety_margin_ms
 
     # 현재 게임 상태에서 다음 돌을 놓을 위치를 결정하는 메소드
     def select_move(self, game_state):
-        root = MCTSNode(game_state)
-        
-        for i in range(self.num_rounds):
-            node = root
-            while (not node.can_add_child()) and (not node.is_terminal()):
-                node = self.select_child(node)
+        player = game_state.next_player
+        deadline = agent.Deadline(self.time_budget_ms, self.safety_margin_ms)
 
-            if node.can_add_child():
-                node = node.add_random_child()
+        # 루트의 자식 노드마다 (행동, 시뮬레이션 횟수, 이긴 횟수)를 모은다.
+        if self.parallel == 'root':
+            stats = self.search_root_parallel(game_state, deadline)
+        else:
+            root = self.find_root(game_state)
 
-            winner = self.simulate_random_game(node.game_state)
+            # 이어서 쓰는 트리는 탐색 횟수가 num_rounds가 될 때까지만 탐색한다.
+            num_rounds = max(self.num_rounds - root.num_rollouts // self.rollouts_per_leaf, 1)
+            if self.parallel == 'tree':
+                self.search_tree_parallel(root, num_rounds, deadline)
+            else:
+                self.search(root, num_rounds, deadline)
 
-            while node is not None:
-                node.record_win(winner)
-                node = node.parent
+            stats = [(child.move, child.num_rollouts, child.win_counts[player]) for child in root.children]
+
+            if self.reuse_tree:
+                self.root = root
 
         scored_moves = [
-            (child.winning_frac(game_state.next_player), child.move, child.num_rollouts)
-            for child in root.children
+            (float(wins) / float(num_rollouts), move, num_rollouts)
+            for move, num_rollouts, wins in stats
         ]
         scored_moves.sort(key=lambda x: x[0], reverse=True)
         for s, m, n in scored_moves[:10]:
             print('%s - %.3f (%d)' % (m, s, n))
 
-        best_move = None
-        best_pct = -1.0
-        for child in root.children:
-            child_pct = child.winning_frac(game_state.next_player)
-            if child_pct > best_pct:
-                best_pct = child_pct
-                best_move = child.move
+        best_pct, best_move, _ = scored_moves[0]
         print('Select move %s with win pct %.3f' % (best_move, best_pct))
+
         return best_move
 
+    # 트리를 num_rounds번 탐색하는 메소드 (선택, 확장, 시뮬레이션, 역전파)
+    # deadline이 주어지면 적어도 한 번 탐색한 뒤에는 시간이 다 됐을 때 멈춘다.
+    def search(self, root, num_rounds, deadline=None):
+        for i in range(num_rounds):
+            if i > 0 and deadline is not None and deadline.expired():
+                break
+
+            node = root
+            while (not node.can_add_child()) and (not node.is_terminal()):
+                node = self.select_child(node)
+
+            if node.can_add_child():
+                node = node.add_random_child()
+
+            results = self.simulate(node.game_state)
+
+            while node is not None:
+                for winner, count in results:
+                    node.record_win(winner, count)
+                node = node.parent
+
+    # 여러 스레드가 하나의 트리를 함께 num_rounds번 탐색하는 메소드
+    def search_tree_parallel(self, root, num_rounds, deadline=None):
+        counter = itertools.count()
+
+        def worker():
+            while True:
+                i = next(counter)
+                if i >= num_rounds or (i > 0 and deadline is not None and deadline.expired()):
+                    break
+                self.search_with_virtual_loss(root)
+
+        threads = [threading.Thread(target=worker) for _ in range(self.num_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # 가상 손실을 걸면서 트리를 한 번 탐색하는 메소드
+    # 노드를 고르거나 넓히는 동안에는 그 노드의 잠금을 잡고, 시뮬레이션은 잠금 없이 한다.
+    def search_with_virtual_loss(self, root):
+        node = root
+        while True:
+            with node.lock:
+                if node.is_terminal() and not node.can_add_child():
+                    break
+
+                expand = node.can_add_child()
+                child = node.add_random_child() if expand else self.select_child(node)
+                child.virtual_loss += self.rollouts_per_leaf
+
+            node = child
+            if expand:
+                break
+
+        results = self.simulate(node.game_state)
+
+        while node is not None:
+            with node.lock:
+                for winner, count in results:
+                    node.record_win(winner, count)
+                if node is not root:
+                    node.virtual_loss -= self.rollouts_per_leaf
+            node = node.parent
+
+    # 프로세스마다 독립된 트리를 탐색해서 루트의 자식 노드 통계를 합치는 메소드
+    def search_root_parallel(self, game_state, deadline=None):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.num_workers)
+
+        # 프로세스마다 남은 시간으로 자신의 제한 시간을 정한다.
+        num_rounds = max(-(-self.num_rounds // self.num_workers), 1)
+        time_budget_ms = deadline.remaining() * 1000 if deadline is not None and deadline.end is not None else None
+        tasks = [(game_state, num_rounds, self.temperature, self.rollouts_per_leaf, random.getrandbits(63), time_budget_ms) \
+            for _ in range(self.num_workers)]
+
+        merged = {}
+        for results in self.pool.map(search_independent_tree, tasks):
+            for point, num_rollouts, wins in results:
+                total_rollouts, total_wins = merged.get(point, (0, 0))
+                merged[point] = (total_rollouts + num_rollouts, total_wins + wins)
+
+        return [(Move.play(point), num_rollouts, wins) for point, (num_rollouts, wins) in merged.items()]
+
+    # 프로세스 풀을 닫는 메소드
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    # 이전 탐색 트리에서 현재 게임 상태에 해당하는 노드를 찾는 메소드
+    def find_root(self, game_state):
+        if self.root is not None:
+            key = game_state.key()
+            # 자신의 수와 상대의 수까지 최대 두 수 아래의 노드에서 찾는다.
+            nodes = [self.root]
+            for depth in range(3):
+                for node in nodes:
+                    if node.game_state.key() == key:
+                        node.parent = None
+                        return node
+                nodes = [child for node in nodes for child in node.children]
+        return MCTSNode(game_state)
+
     # 탐색할 자식 노드를 선택하는 메소드
+    # 트리 병렬 탐색에서는 가상 손실을 진 것으로 계산해서 다른 스레드가 같은 경로로 내려오지 않게 한다.
     def select_child(self, node):
-        total_rollouts = sum(child.num_rollouts for child in node.children)
+        total_rollouts = sum(child.num_visits for child in node.children)
         log_rollouts = math.log(total_rollouts)
 
         best_score = -1
         best_child = None
 
         for child in node.children:
-            win_percentage = child.winning_frac(node.game_state.next_player)
-            exploration_factor = math.sqrt(log_rollouts / child.num_rollouts)
+            win_percentage = float(child.win_counts[node.game_state.next_player]) / float(child.num_visits)
+            exploration_factor = math.sqrt(log_rollouts / child.num_visits)
             uct_score = win_percentage + self.temperature * exploration_factor
 
             if uct_score > best_score:
@@ -139,19 +292,25 @@ class MCTSAgent(agent.Agent):
                 best_child = child
         return best_child
 
+    # 잎 노드에서 무작위 시뮬레이션을 해서 (승자, 횟수) 목록을 반환하는 메소드
+    def simulate(self, game):
+        if self.rollouts_per_leaf == 1:
+            return [(self.simulate_random_game(game), 1)]
+        return self.simulate_random_games(game, self.rollouts_per_leaf)
+
     # 게임을 무작위 시뮬레이션 하는 메소드
     @staticmethod
     def simulate_random_game(game):
-        bots = {
-            Player.black: agent.RandomBot(),
-            Player.white: agent.RandomBot(),            
-        }
-        while not game.is_over():
-            bot_move = bots[game.next_player].select_move(game)
-            game = game.apply_move(bot_move)
-        if game.winner is "Black":
-            return Player.black
-        elif game.winner is "White":
-            return Player.white
-        else:
-            return 0
\ No newline at end of file
+        return rollout.random_rollout(game)
+
+    # 게임을 여러 번 한꺼번에 무작위 시뮬레이션 해서 (승자, 횟수) 목록을 반환하는 메소드
+    @staticmethod
+    def simulate_random_games(game, num_games):
+        if game.is_over():
+            return [(rollout.winner_of(game), num_games)]
+
+        grids = np.repeat(game.board.to_array()[np.newaxis], num_games, axis=0)
+        winners = rollout.batch_rollout(grids, np.full(num_games, int(game.next_player)))
+        counts = np.bincount(winners, minlength=3)
+
+        return [(winner, int(counts[winner])) for winner in (0, Player.black, Player.white) if counts[winner] > 0]
@@ -0,0 +1,125 @@
+import random
+
+import numpy as np
+
+from connect5.types import Player
+
+# 바둑판 바깥을 나타내는 값
+OUTSIDE = -1
+
+# 게임 상태의 승자를 문자열에서 Player(무승부는 0)로 바꾸는 함수
+def winner_of(game_state):
+    if game_state.winner == "Black":
+        return Player.black
+    if game_state.winner == "White":
+        return Player.white
+    return 0
+
+# 테두리를 한 칸씩 두른 바둑판을 1차원 리스트로 만드는 함수
+# 테두리 덕분에 줄을 셀 때 바둑판 바깥인지 따로 확인하지 않아도 된다.
+def flat_board(grid):
+    num_rows, num_cols = grid.shape
+    padded = np.full((num_rows + 2, num_cols + 2), OUTSIDE, dtype=np.int64)
+    padded[1:-1, 1:-1] = grid
+
+    return padded.reshape(-1).tolist()
+
+# 놓인 돌을 지나는 한 방향의 줄에 같은 색깔의 돌이 몇 개 이어져 있는지 세는 함수
+def count_line(cells, index, offset):
+    player = cells[index]
+    count = 1
+
+    cur = index + offset
+    while cells[cur] == player:
+        count += 1
+        cur += offset
+
+    cur = index - offset
+    while cells[cur] == player:
+        count += 1
+        cur -= offset
+
+    return count
+
+# 게임 상태에서 끝까지 무작위로 두고 승자(흑돌, 백돌, 무승부는 0)를 반환하는 함수
+# GameState를 만들지 않고 1차원 리스트에 돌을 놓으며, 승리 조건은 놓은 돌 주위에서만 확인한다.
+def random_rollout(game_state):
+    if game_state.is_over():
+        return winner_of(game_state)
+
+    grid = game_state.board.to_array()
+    num_cols = grid.shape[1]
+    width = num_cols + 2
+    offsets = (1, width, width + 1, width - 1)
+
+    cells = flat_board(grid)
+
+    # 빈 위치를 한 번만 섞어두고 차례대로 두면 매번 무작위로 고르는 것과 같다.
+    empty = [(row + 1) * width + col + 1 for row, col in np.argwhere(grid == 0).tolist()]
+    random.shuffle(empty)
+
+    player = int(game_state.next_player)
+    for index in empty:
+        cells[index] = player
+
+        # 같은 색깔인 돌이 정확히 4개 이어지면 이긴다.
+        for offset in offsets:
+            if count_line(cells, index, offset) == 4:
+                return Player(player)
+
+        player = 3 - player
+
+    return 0
+
+# 여러 게임을 한꺼번에 끝까지 무작위로 두고 게임마다 승자(흑돌, 백돌, 무승부는 0)를 반환하는 함수
+# grids는 (N, 행, 열) 크기의 int8 배열이고, next_players는 게임마다 다음에 둘 플레이어이다.
+# 시작 국면은 끝나지 않은 국면이어야 한다.
+def batch_rollout(grids, next_players):
+    grids = np.asarray(grids, dtype=np.int8)
+    num_games, num_rows, num_cols = grids.shape
+    players = np.array(next_players, dtype=np.int8).reshape(num_games)
+
+    # 테두리를 네 칸씩 둘러서 놓은 돌에서 네 칸 떨어진 곳까지 바둑판 바깥인지 확인하지 않고 읽는다.
+    width = num_cols + 8
+    cells = np.full((num_games, num_rows + 8, width), OUTSIDE, dtype=np.int8)
+    cells[:, 4:-4, 4:-4] = grids
+    cells = cells.reshape(num_games, -1)
+
+    # 1차원으로 편 바둑판의 인덱스를 테두리를 두른 판의 인덱스로 바꾸는 배열
+    index = np.arange(num_rows * num_cols)
+    padded_index = (index // num_cols + 4) * width + index % num_cols + 4
+
+    # 방향마다 놓은 돌에서 -4칸부터 4칸까지의 위치
+    steps = np.arange(-4, 5)
+    offsets = np.array([1, width, width + 1, width - 1])[:, None] * steps[None, :]
+
+    # 게임마다 빈 위치를 무작위 순서로 한 번만 섞어둔다. (빈 위치가 앞쪽에 오도록 정렬한다.)
+    flat = grids.reshape(num_games, -1)
+    keys = np.random.random_sample(flat.shape)
+    keys[flat != 0] = 2
+    order = padded_index[np.argsort(keys, axis=1)]
+    num_empty = (flat == 0).sum(axis=1)
+
+    winners = np.zeros(num_games, dtype=np.int8)
+    active = np.arange(num_games)
+
+    for ply in range(num_rows * num_cols):
+        active = active[num_empty[active] > ply]
+        if len(active) == 0:
+            break
+
+        points = order[active, ply]
+        cells[active, points] = players[active]
+
+        # 놓은 돌을 지나는 네 방향의 줄을 모아서 같은 색깔인 돌이 정확히 4개 이어졌는지 확인한다.
+        lines = cells[active[:, None, None], points[:, None, None] + offsets] == players[active, None, None]
+        forward = np.cumprod(lines[:, :, 5:], axis=2).sum(axis=2)
+        backward = np.cumprod(lines[:, :, 3::-1], axis=2).sum(axis=2)
+        won = (forward + backward == 3).any(axis=1)
+
+        winners[active[won]] = players[active[won]]
+
+        active = active[~won]
+        players[active] = 3 - players[active]
+
+    return winners
@@ -26,4 +26,17 @@ class Direction(enum.Enum):
     right = 1       # 오른쪽
     down = 2        # 아래
     right_down = 3  # 오른쪽 아래
-    left_down = 4   # 왼쪽 아래
\ No newline at end of file
+    left_down = 4   # 왼쪽 아래
+
+    # 방향에 따른 (행, 열)의 변화량을 반환하는 메소드
+    @property
+    def delta(self):
+        return DIRECTION_DELTA[self]
+
+# 방향별 (행, 열)의 변화량
+DIRECTION_DELTA = {
+    Direction.right: (0, 1),
+    Direction.down: (1, 0),
+    Direction.right_down: (1, 1),
+    Direction.left_down: (1, -1),
+}
\ No newline at end of file
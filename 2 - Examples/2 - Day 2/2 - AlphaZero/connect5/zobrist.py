@@ -1,6 +1,6 @@
 from connect5.types import Player, Point
 
-__all__ = ['HASH_CODE', 'EMPTY_BOARD']
+__all__ = ['HASH_CODE', 'EMPTY_BOARD', 'WHITE_TO_MOVE']
 
 HASH_CODE = {
     (Point(row=1, col=1), None): 6402364705153495313,
@@ -1088,4 +1088,6 @@ HASH_CODE = {
     (Point(row=19, col=19), Player.white): 6217718608968288470,
 }
 
-EMPTY_BOARD = 9181944435492932548
\ No newline at end of file
+EMPTY_BOARD = 9181944435492932548
+
+WHITE_TO_MOVE = 2037756491388961605
\ No newline at end of file
@@ -11,7 +11,8 @@ import sys
 def main():
     board_size = 6
     game = connect5_board.GameState.new_game(board_size)
-    bot = AZAgent(board_size, torch.load(sys.argv[1]), rounds_per_move=400)
+    # 한 번에 여러 잎 노드를 평가해서 신경망 연산이 모든 CPU 코어를 쓰게 한다.
+    bot = AZAgent(board_size, torch.load(sys.argv[1]), rounds_per_move=400, batch_size=8)
 
     while not game.is_over():
         print(chr(27) + "[2J")
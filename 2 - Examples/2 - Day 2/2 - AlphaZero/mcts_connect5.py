@@ -1,3 +1,5 @@
+import os
+
 from six.moves import input
 
 from connect5 import board as connect5_board
@@ -6,10 +8,12 @@ from connect5 import mcts
 from connect5.utils import print_board, print_move, point_from_coords
 
 BOARD_SIZE = 5
+# 탐색에 쓸 CPU 코어의 개수
+NUM_WORKERS = os.cpu_count()
 
 def main():
     game = connect5_board.GameState.new_game(BOARD_SIZE)
-    bot = mcts.MCTSAgent(500, temperature=1.4)
+    bot = mcts.MCTSAgent(500 * NUM_WORKERS, temperature=1.4, parallel='root', num_workers=NUM_WORKERS)
 
     while not game.is_over():
         print_board(game.board)
@@ -22,5 +26,7 @@ def main():
         print_move(game.next_player, move)
         game = game.apply_move(move)
 
+    bot.close()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,17 +1,20 @@
-import multiprocessing as mp
 import os
 import time
+from queue import Empty
 
 import numpy as np
 import torch
+import torch.multiprocessing as mp
 import torch.nn.functional as F
 from tensorboardX import SummaryWriter
 from torch import optim
 
 from alphazero import preprocess
+from alphazero.inference import RemoteNetwork, inference_server
 from alphazero.mcts import AZAgent
 from alphazero.network import Network
-from alphazero.replaybuffer import ReplayBuffer
+from alphazero.replaybuffer import MappedReplayBuffer, ReplayBuffer
+from alphazero.weights import SharedWeights, publish_weights
 from connect5 import agent
 from connect5 import board as connect5_board
 from connect5 import types
@@ -29,49 +32,95 @@ TRAINING_CONFIG = {
     'PUCT': 1.25,
     'PUCT_INIT': 1.25,
     'PUCT_BASE': 19652,
+    'TABLE_SIZE': 0,
+    'SEARCH_BATCH_SIZE': 8,
+    'SYMMETRY_MODE': 'random',
+    # 기록되는 수의 비율과 아낀 탐색 횟수를 함께 재보기 전까지는 끈다.
+    'EARLY_STOP': False,
+    'FULL_SEARCH_PROB': 0.25,
 
     'MCTS_NOISE': True,
     'MCTS_ALPHA': 0.03,
     'MCTS_EPS': 0.25,
 
     'SELFPLAY_WORKERS': 12,
+    'INFERENCE_SERVER': False,
+    'INFERENCE_BATCH_SIZE': 64,
+    'INFERENCE_MAX_LATENCY': 0.005,
     'START_TRAINING': 1280,
-    'EPOCH': 1,
+    'SAMPLES_PER_GAME': 128,
+    'CHECKPOINT_INTERVAL': 100,
+    'PUBLISH_INTERVAL': 10,
+    'WEIGHTS_DIR': 'models',
     'BATCH_SIZE': 128,
     'CAPACITY': 10000,
+    'REPLAY_FILE': 'models/replay.bin',
+    'AUGMENT': True,
+    'PRIORITIZED': False,
+    'PRIORITY_ALPHA': 0.6,
+    'PRIORITY_BETA': 0.4,
 
     'LOAD_CHECKPOINT': 0
 }
 
-buffer = ReplayBuffer(TRAINING_CONFIG['CAPACITY'])
+# 학습할 신경망을 만드는 함수
+def create_network():
+    network = Network(TRAINING_CONFIG['BOARD_SIZE'])
 
-target_network = Network(TRAINING_CONFIG['BOARD_SIZE'])
+    if USE_CUDA:
+        network = network.cuda()
 
-if USE_CUDA:
-    target_network = target_network.cuda()
+    if TRAINING_CONFIG['LOAD_CHECKPOINT'] != 0:
+        network.load_state_dict(torch.load(f'models/checkpoint-{TRAINING_CONFIG["LOAD_CHECKPOINT"]}.bin'))
 
-if TRAINING_CONFIG['LOAD_CHECKPOINT'] != 0:
-    target_network.load_state_dict(torch.load(f'models/checkpoint-{TRAINING_CONFIG["LOAD_CHECKPOINT"]}.bin'))
+    return network
 
 # 자가 대국을 하는 작업자
-def selfplay_worker(queue):
+# shared_weights가 주어지면 대국마다 학습기와 공유하는 신경망을 빌려서 쓰고, 아니면 network(추론 서버에 연산을 요청하는 RemoteNetwork)를 쓴다.
+# 신경망을 복사하지 않고 에이전트도 한 번만 만들어서 대국마다 초기화해서 쓴다.
+def selfplay_worker(queue, network=None, shared_weights=None):
+    if shared_weights is not None:
+        network = shared_weights.networks[0]
+
+    agent = AZAgent(TRAINING_CONFIG['BOARD_SIZE'], None, \
+        TRAINING_CONFIG['MCTS_NOISE'], TRAINING_CONFIG['MCTS_ALPHA'], TRAINING_CONFIG['MCTS_EPS'], \
+        TRAINING_CONFIG['ROUNDS_PER_MOVE'], TRAINING_CONFIG['PUCT_INIT'], TRAINING_CONFIG['PUCT_BASE'], \
+        TRAINING_CONFIG['TABLE_SIZE'], batch_size=TRAINING_CONFIG['SEARCH_BATCH_SIZE'], network=network, \
+        symmetry_mode=TRAINING_CONFIG['SYMMETRY_MODE'], early_stop=TRAINING_CONFIG['EARLY_STOP'], \
+        full_search_prob=TRAINING_CONFIG['FULL_SEARCH_PROB'])
+
     while True:
-        game = connect5_board.GameState.new_game(TRAINING_CONFIG['BOARD_SIZE'])
-        agent = AZAgent(TRAINING_CONFIG['BOARD_SIZE'], target_network.state_dict(), \
-            TRAINING_CONFIG['MCTS_NOISE'], TRAINING_CONFIG['MCTS_ALPHA'], TRAINING_CONFIG['MCTS_EPS'], \
-            TRAINING_CONFIG['ROUNDS_PER_MOVE'], TRAINING_CONFIG['PUCT_INIT'], TRAINING_CONFIG['PUCT_BASE'])
+        # 대국 중에는 가중치가 바뀌지 않도록 대국을 시작할 때 빌린 신경망만 쓴다.
+        if shared_weights is not None:
+            index, network, game_version = shared_weights.acquire()
+            agent.reset(network)
+        else:
+            network.new_game()
+            agent.reset()
+
+        # 대국 중에 예외가 생겨도 빌린 신경망은 돌려줘야 학습기가 새 가중치를 쓸 수 있다.
+        try:
+            game = connect5_board.GameState.new_game(TRAINING_CONFIG['BOARD_SIZE'])
+            while not game.is_over():
+                move = agent.select_move(game, TRAINING_CONFIG['PUCT'])
+                game = game.apply_move(move)
+        finally:
+            if shared_weights is not None:
+                shared_weights.release(index)
 
-        while not game.is_over():
-            move = agent.select_move(game, TRAINING_CONFIG['PUCT'])
-            game = game.apply_move(move)
+        if shared_weights is None:
+            # 추론 서버 모드에서는 대국을 시작할 때 추론 서버가 정해준 가중치의 버전을 기록한다.
+            game_version = network.version
 
-        queue.put((game.winner, agent.train_data))
+        queue.put((game.winner, agent.train_data, game_version, agent.stats))
 
 # 프로그램의 메인 함수
 def main():
     step = TRAINING_CONFIG['LOAD_CHECKPOINT']
     num_game = 0
 
+    target_network = create_network()
+
     manager = mp.Manager()
     queue = manager.Queue()
 
@@ -82,60 +131,143 @@ def main():
     if not os.path.exists('models'):
         os.mkdir('models')
 
+    # 버퍼를 파일에 저장하면 체크포인트에서 다시 시작할 때 이전 샘플을 이어서 쓴다.
+    if TRAINING_CONFIG['REPLAY_FILE'] is None:
+        buffer = ReplayBuffer(TRAINING_CONFIG['CAPACITY'], TRAINING_CONFIG['AUGMENT'], \
+            TRAINING_CONFIG['PRIORITIZED'], TRAINING_CONFIG['PRIORITY_ALPHA'], TRAINING_CONFIG['PRIORITY_BETA'])
+    else:
+        buffer = MappedReplayBuffer(TRAINING_CONFIG['REPLAY_FILE'], TRAINING_CONFIG['CAPACITY'], \
+            resume=TRAINING_CONFIG['LOAD_CHECKPOINT'] != 0, augment=TRAINING_CONFIG['AUGMENT'], \
+            prioritized=TRAINING_CONFIG['PRIORITIZED'], alpha=TRAINING_CONFIG['PRIORITY_ALPHA'], beta=TRAINING_CONFIG['PRIORITY_BETA'])
+        print(f'replay buffer has {len(buffer)} samples')
+
+    # 작업자들이 지금 가중치로 시작하도록 먼저 내보낸다.
+    publish_weights(TRAINING_CONFIG['WEIGHTS_DIR'], step, target_network.state_dict())
+
     # 작업자를 만드는 부분
     workers = []
-    for _ in range(TRAINING_CONFIG['SELFPLAY_WORKERS']):
-        p = mp.Process(target=selfplay_worker, args=(queue,))
+
+    shared_weights = None
+
+    if TRAINING_CONFIG['INFERENCE_SERVER']:
+        request_queue = mp.Queue()
+        response_queues = [mp.Queue() for _ in range(TRAINING_CONFIG['SELFPLAY_WORKERS'])]
+
+        p = mp.Process(target=inference_server, args=(TRAINING_CONFIG['BOARD_SIZE'], target_network.state_dict(), \
+            request_queue, response_queues, TRAINING_CONFIG['INFERENCE_BATCH_SIZE'], TRAINING_CONFIG['INFERENCE_MAX_LATENCY'], \
+            TRAINING_CONFIG['WEIGHTS_DIR'], step))
+        p.daemon = True
+        p.start()
+
+        workers.append(p)
+        networks = [RemoteNetwork(i, request_queue, response_queues[i]) for i in range(TRAINING_CONFIG['SELFPLAY_WORKERS'])]
+    else:
+        # 작업자들이 함께 읽는 두 벌의 신경망 (CPU에서는 공유 메모리에, GPU에서는 CUDA IPC로 공유한다.)
+        shared_networks = [create_network() for _ in range(2)]
+        for network in shared_networks:
+            network.load_state_dict(target_network.state_dict())
+
+        shared_weights = SharedWeights(shared_networks, step)
+        networks = [None] * TRAINING_CONFIG['SELFPLAY_WORKERS']
+
+    for network in networks:
+        p = mp.Process(target=selfplay_worker, args=(queue, network, shared_weights))
         p.daemon = True
         p.start()
 
         workers.append(p)
 
     # 학습을 돌리는 코드
+    # 자가 대국 결과가 도착하는 것과 상관없이 학습을 계속 돌리고, 대국 하나당 SAMPLES_PER_GAME개의 샘플만큼 학습한다.
+    credit = 0
+    # 공유 신경망에 아직 쓰지 못한 새 가중치가 있는지 여부와 그 가중치를 처음 쓰려고 한 학습 단계
+    pending_publish = False
+    pending_since = step
+
     while True:
         try:
-            winner, result = queue.get()
-            buffer.push(winner, result)
-            
-            num_game += 1
-            print(f'selfplay game #{num_game}')
+            # 큐에 쌓인 대국 결과를 한 번에 가져온다. 학습할 몫이 남아 있지 않으면 다음 대국을 기다린다.
+            games = []
+            if len(buffer) < TRAINING_CONFIG['START_TRAINING'] or credit < TRAINING_CONFIG['BATCH_SIZE']:
+                games.append(queue.get())
+            while True:
+                try:
+                    games.append(queue.get_nowait())
+                except Empty:
+                    break
+
+            for winner, result, version, stats in games:
+                buffer.push(winner, result, version)
+
+                num_game += 1
+                print(f'selfplay game #{num_game} (weights #{version})')
+                writer.add_scalar('selfplay weight lag', step - version, num_game)
+
+                # 탐색을 일찍 멈춰서 아낀 탐색 횟수의 비율
+                planned = stats['simulations'] + stats['saved_simulations']
+                writer.add_scalar('selfplay saved simulations', stats['saved_simulations'] / max(planned, 1), num_game)
+                writer.add_scalar('selfplay simulations per move', stats['simulations'] / max(stats['moves'], 1), num_game)
+                # 학습 데이터로 기록한 수의 비율
+                writer.add_scalar('selfplay recorded moves', stats['recorded_moves'] / max(stats['moves'], 1), num_game)
 
             if len(buffer) < TRAINING_CONFIG['START_TRAINING']:
                 continue
 
-            step += 1
-            print(f'start training #{step}')
+            credit += len(games) * TRAINING_CONFIG['SAMPLES_PER_GAME']
+            if credit < TRAINING_CONFIG['BATCH_SIZE']:
+                continue
 
-            total_pi = 0
-            total_v = 0
-            total_loss = 0
+            step += 1
+            credit -= TRAINING_CONFIG['BATCH_SIZE']
 
-            for _ in range(TRAINING_CONFIG['EPOCH']):
+            if TRAINING_CONFIG['PRIORITIZED']:
+                states, pis, values, weights, positions = buffer.sample_prioritized(TRAINING_CONFIG['BATCH_SIZE'])
+            else:
                 states, pis, values = buffer.sample(TRAINING_CONFIG['BATCH_SIZE'])
-                if USE_CUDA:
-                    states, pis, values = states.cuda(), pis.cuda(), values.cuda()
-
-                opt.zero_grad()
-                out_pi, out_v = target_network(states)
-                out_pi = F.log_softmax(out_pi, dim=1)
-
-                loss_pi = -(out_pi * pis).sum(dim=1).mean()
-                loss_v = F.mse_loss(out_v, values)
-                
-                loss = loss_pi + loss_v
-                loss.backward()
-                opt.step()
-
-                total_pi = loss_pi.item()
-                total_v = loss_v.item()
-                total_loss = loss.item()
-
-            buffer.clear_half()
-            torch.save(target_network.state_dict(), f'models/checkpoint-{step}.bin')
-
-            writer.add_scalar('train total loss', total_loss / TRAINING_CONFIG['EPOCH'], step)
-            writer.add_scalar('train pi loss', total_pi / TRAINING_CONFIG['EPOCH'], step)
-            writer.add_scalar('train value loss', total_v / TRAINING_CONFIG['EPOCH'], step)
+                weights = torch.ones(values.size())
+            if USE_CUDA:
+                states, pis, values, weights = states.cuda(), pis.cuda(), values.cuda(), weights.cuda()
+
+            opt.zero_grad()
+            out_pi, out_v = target_network(states)
+            out_pi = F.log_softmax(out_pi, dim=1)
+
+            # 샘플마다 손실을 구하고 중요도 가중치를 곱해서 평균을 낸다.
+            sample_pi = -(out_pi * pis).sum(dim=1, keepdim=True)
+            sample_v = (out_v - values) ** 2
+
+            loss_pi = (weights * sample_pi).mean()
+            loss_v = (weights * sample_v).mean()
+
+            loss = loss_pi + loss_v
+            loss.backward()
+            opt.step()
+
+            if TRAINING_CONFIG['PRIORITIZED']:
+                buffer.update_priorities(positions, (sample_pi + sample_v).detach().view(-1).cpu().numpy())
+
+            writer.add_scalar('train total loss', loss.item(), step)
+            writer.add_scalar('train pi loss', loss_pi.item(), step)
+            writer.add_scalar('train value loss', loss_v.item(), step)
+
+            if step % TRAINING_CONFIG['PUBLISH_INTERVAL'] == 0:
+                publish_weights(TRAINING_CONFIG['WEIGHTS_DIR'], step, target_network.state_dict())
+                if shared_weights is not None and not pending_publish:
+                    pending_publish = True
+                    pending_since = step
+
+            # 이전 가중치로 두는 대국이 남아 있으면 다음 학습 단계에서 다시 시도한다.
+            if pending_publish:
+                pending_publish = not shared_weights.publish(step, target_network.state_dict())
+
+                # 너무 오래 쓰지 못하면 멈춘 작업자가 신경망을 돌려주지 않은 것일 수 있다.
+                waited = step - pending_since
+                if pending_publish and waited > 0 and waited % (10 * TRAINING_CONFIG['PUBLISH_INTERVAL']) == 0:
+                    print(f'shared weights are still in use, publish has been pending for {waited} steps')
+
+            if step % TRAINING_CONFIG['CHECKPOINT_INTERVAL'] == 0:
+                print(f'save checkpoint #{step}')
+                torch.save(target_network.state_dict(), f'models/checkpoint-{step}.bin')
         except KeyboardInterrupt:
             print('Stopping training...')
 
@@ -23,11 +23,17 @@ BOARD_SIZE = 7
 # 서버 주소입니다.
 HOST = 'http://18.189.17.31:80/'
 
+# bot이 한 수를 두는 데 쓸 시간(ms)입니다. 서버의 제한 시간에 맞춰 정해주세요.
+TIME_BUDGET_MS = 3000
+# 서버와 통신하는 데 걸리는 시간(ms)만큼 일찍 탐색을 끝냅니다.
+SAFETY_MARGIN_MS = 300
+
 
 def main():
     game = connect5_board.GameState.new_game(BOARD_SIZE)
     # 사용하고 싶은 bot을 넣어주세요.
-    bot = AZAgent(BOARD_SIZE, torch.load(sys.argv[1]), rounds_per_move=400)
+    bot = AZAgent(BOARD_SIZE, torch.load(sys.argv[1]), rounds_per_move=400, batch_size=8, \
+        time_budget_ms=TIME_BUDGET_MS, safety_margin_ms=SAFETY_MARGIN_MS)
 
     # bot의 name을 정합니다. 다른 팀과 중복되면 안됩니다.
     name = 'c301-bot'